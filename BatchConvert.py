@@ -0,0 +1,340 @@
+#! /usr/bin/python
+
+"""
+BatchConvert.py - Convert many T2 and UEF files at once using a pool of
+                  processes.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import fnmatch, multiprocessing, os, string, sys
+import cmdline
+import convert, gzipwriter, sinks
+
+version = "0.10 (Fri 16th October 2026)"
+
+# The conversions available and the suffix added to the name of each output
+# file, or None if the output is a directory.
+conversions = {"T2UEF": ".uef", "T2INF": None, "UEF2INF": None}
+
+# Fields written to the summary file for each input file.
+summary_fields = ("files", "blocks", "bad blocks", "bytes")
+
+
+def find_inputs(source, pattern):
+
+    # Return a list of input files and the names to use for their output,
+    # either from a directory and its subdirectories or from a file listing
+    # one input file on each line.
+
+    inputs = []
+
+    if os.path.isdir(source):
+
+        for dir_path, dir_names, file_names in os.walk(source):
+
+            dir_names.sort()
+            file_names.sort()
+
+            for name in fnmatch.filter(file_names, pattern):
+                path = os.path.join(dir_path, name)
+                inputs.append((path, os.path.relpath(path, source)))
+    else:
+        if source == "-":
+            lines = sys.stdin.readlines()
+        else:
+            lines = open(source, "r").readlines()
+
+        for line in lines:
+            path = string.strip(line)
+            if path != "":
+                inputs.append((path, os.path.basename(path)))
+
+    return inputs
+
+
+def make_jobs(inputs, conversion, out_dir, options):
+
+    # Create a job for each input file, making sure that no two jobs write
+    # to the same output.
+
+    jobs = []
+    used = {}
+    suffix = conversions[conversion]
+    if suffix is None:
+        suffix = sinks.formats[options["format"]]
+
+    for path, name in inputs:
+
+        stem = os.path.splitext(name)[0]
+        output = stem
+        n = 1
+        while used.has_key(output):
+            output = stem + "-" + str(n)
+            n = n + 1
+        used[output] = 1
+
+        output = os.path.join(out_dir, output)
+        if suffix is not None:
+            output = output + suffix
+
+        jobs.append((conversion, path, output, options))
+
+    return jobs
+
+
+def convert_file(job):
+
+    # Perform a single conversion, returning its status instead of raising
+    # an exception so that one bad file does not stop the others.
+
+    conversion, path, output, options = job
+
+    try:
+        parent = os.path.dirname(output)
+        if parent != "" and not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # Another process may have created it.
+                if not os.path.isdir(parent):
+                    raise
+
+        if conversion == "T2UEF":
+            # Each worker compresses on a single thread, as the pool already
+            # occupies every processor
+            summary = convert.t2_to_uef(path, output, options["compress"],
+                                        options["level"], options["verify"],
+                                        "BatchConvert " + version, threads = 1)
+        elif conversion == "T2INF":
+            summary = convert.t2_to_inf(path, output, verify = options["verify"],
+                                        format = options["format"],
+                                        store = options["store"])
+        else:
+            summary = convert.uef_to_inf(path, output, verify = options["verify"],
+                                         format = options["format"],
+                                         store = options["store"])
+
+    except KeyboardInterrupt:
+        raise
+    except Exception, e:
+        message = str(e)
+        if message == "":
+            message = e.__class__.__name__
+
+        # Remove incomplete UEF files
+        if os.path.isfile(output):
+            try:
+                os.remove(output)
+            except OSError:
+                pass
+
+        return ("error", path, output, None, message)
+
+    if summary["bad blocks"] > 0:
+        return ("bad", path, output, summary, "Corrupt blocks found")
+
+    return ("ok", path, output, summary, "")
+
+
+def run(jobs, processes):
+
+    # Perform the jobs, using a pool of processes if more than one process is
+    # to be used, and return the results in the order of the jobs.
+
+    if processes == 1 or len(jobs) <= 1:
+        return map(convert_file, jobs)
+
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        # Hand out the jobs in batches to reduce the communication between
+        # processes while keeping them all busy.
+        chunksize = max(1, len(jobs) // (processes * 8))
+        results = list(pool.imap(convert_file, jobs, chunksize))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+
+    pool.join()
+    return results
+
+
+def write_summary(f, results):
+
+    f.write("# status\tinput\toutput\t" + string.join(summary_fields, "\t") + "\tmessage\n")
+
+    for status, path, output, summary, message in results:
+
+        if summary is None:
+            values = [""] * len(summary_fields)
+        else:
+            values = map(lambda field: str(summary[field]), summary_fields)
+
+        f.write(string.join([status, path, output] + values + [message], "\t") + "\n")
+
+
+if __name__ == "__main__":
+
+    syntax = "[-j <processes>] [-c] [--level <compression level>] [--verify] " \
+             "[--format <output format>] [--store <store directory>] " \
+             "[--pattern <pattern>] [--summary <summary file>] " \
+             "<conversion> <source> <destination path>"
+
+    # Parse the arguments without loading cmdsyntax if possible, only using it,
+    # and possibly a GUI, when they cannot be parsed
+
+    match = cmdline.match(syntax, sys.argv[1:])
+
+    if match is None:
+
+        import cmdsyntax
+
+        style = cmdsyntax.Style()
+        style.expand_single = 0
+        style.allow_single_long = 1
+
+        if style.verify() == 0:
+
+            sys.stderr.write("Internal problem: syntax style is inconsistent.\n")
+            sys.exit(1)
+
+        # Create a syntax object.
+        syntax_obj = cmdsyntax.Syntax(syntax, style)
+
+        matches, failed = syntax_obj.get_args(sys.argv[1:], style = style, return_failed = 1)
+
+        if matches == [] and cmdsyntax.use_GUI() != None:
+
+            form = cmdsyntax.Form("BatchConvert", syntax_obj, failed[0])
+
+            matches = form.get_args()
+
+        # Take the first match.
+        if len(matches) > 0:
+
+            match = matches[0]
+
+        else:
+
+            match = None
+
+    if match == {} or match is None or \
+       not conversions.has_key(string.upper(match["conversion"])):
+
+        sys.stderr.write("Syntax: BatchConvert.py %s\n\n" % syntax)
+        sys.stderr.write("BatchConvert version %s\n\n" % version)
+        sys.stderr.write("Convert each file in the directory given by <source>, or listed in the file\n")
+        sys.stderr.write("<source>, using a pool of processes. <conversion> is one of T2UEF, T2INF or\n")
+        sys.stderr.write("UEF2INF. The results are written to <destination path>, as UEF files or as\n")
+        sys.stderr.write("directories of files with .inf files, with names based on the input files.\n")
+        sys.stderr.write("A file which cannot be converted is reported without stopping the others.\n\n")
+        sys.stderr.write("The options perform the following functions:\n\n")
+        sys.stderr.write("-j <processes>          Use the given number of processes (default: one for\n")
+        sys.stderr.write("                        each processor).\n")
+        sys.stderr.write("-c                      Compress UEF files with gzip.\n")
+        sys.stderr.write("--level <level>         Compress UEF files with the given level (1-9).\n")
+        sys.stderr.write("--verify                Check the CRC of each block.\n")
+        sys.stderr.write("--format <format>       Write extracted files to directories (dir, the\n")
+        sys.stderr.write("                        default) or to tar, tgz or zip archives.\n")
+        sys.stderr.write("--store <directory>     Keep one copy of each distinct extracted file in\n")
+        sys.stderr.write("                        <directory> and link to it from each destination.\n")
+        sys.stderr.write("--pattern <pattern>     Only convert files in <source> whose names match the\n")
+        sys.stderr.write("                        pattern (default: *).\n")
+        sys.stderr.write("--summary <file>        Write the result for each file to <file>.\n\n")
+        sys.exit(1)
+
+    conversion = string.upper(match["conversion"])
+
+    options = {"compress": match.has_key("c"), "level": gzipwriter.DEFAULT_LEVEL,
+               "verify": match.has_key("verify"), "format": "dir", "store": None}
+
+    if match.has_key("format"):
+        options["format"] = string.lower(match["output format"])
+        if not sinks.formats.has_key(options["format"]):
+            sys.stderr.write("Unknown output format: %s\n" % options["format"])
+            sys.exit(1)
+
+    if match.has_key("store"):
+        if options["format"] != "dir":
+            sys.stderr.write("A store can only be used when writing to directories.\n")
+            sys.exit(1)
+        options["store"] = os.path.abspath(match["store directory"])
+
+    try:
+        if match.has_key("j"):
+            processes = int(match["processes"])
+            if processes < 1:
+                raise ValueError
+        else:
+            processes = multiprocessing.cpu_count()
+
+        if match.has_key("level"):
+            options["level"] = int(match["compression level"])
+            if options["level"] < 1 or options["level"] > 9:
+                raise ValueError
+            options["compress"] = 1
+
+    except ValueError:
+        sys.stderr.write("The number of processes and compression level must be valid numbers.\n")
+        sys.exit(1)
+
+    if match.has_key("pattern"):
+        pattern = match["pattern"]
+    else:
+        pattern = "*"
+
+    try:
+        inputs = find_inputs(match["source"], pattern)
+    except IOError:
+        sys.stderr.write("The source could not be read: %s\n" % match["source"])
+        sys.exit(1)
+
+    out_dir = match["destination path"]
+
+    if not os.path.isdir(out_dir):
+        try:
+            os.makedirs(out_dir)
+            print "Created directory "+out_dir
+        except OSError:
+            sys.stderr.write("Failed to create the directory: %s\n" % out_dir)
+            sys.exit(1)
+
+    jobs = make_jobs(inputs, conversion, out_dir, options)
+    results = run(jobs, processes)
+
+    if match.has_key("summary"):
+        try:
+            summary_f = open(match["summary file"], "w")
+            write_summary(summary_f, results)
+            summary_f.close()
+        except IOError:
+            sys.stderr.write("Failed to write the summary file: %s\n" % match["summary file"])
+
+    failed = 0
+    for status, path, output, summary, message in results:
+        if status != "ok":
+            sys.stderr.write("%s: %s\n" % (path, message))
+            failed = failed + 1
+
+    print "Converted %i of %i files." % (len(results) - failed, len(results))
+
+    # Exit
+    if failed > 0:
+        sys.exit(1)
+
+    sys.exit()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+
+"""
+ConvertServer.py - Perform conversions requested by other programs over a
+                   Unix socket or a local TCP port, using a pool of processes.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import errno, os, signal, socket, SocketServer, stat, string, sys, threading
+from cStringIO import StringIO
+import cmdline
+import catalog, convert, sinks
+
+version = "0.1 (Fri 16th October 2026)"
+
+# Each request is a line containing a command, any options and the length of
+# the input file, followed by the contents of the input file. The response is
+# a line containing OK and the length of the output, followed by the output,
+# or a line containing ERROR and a message.
+#
+#   T2UEF [-c] <length>            A UEF file, compressed with gzip if -c is
+#                                  given.
+#   T2INF <format> <length>        The files in a T2 or UEF file and their
+#   UEF2INF <format> <length>      .inf files as a tar, tgz or zip archive.
+#   T2LIST <length>                A line for each file in a T2 or UEF file
+#   UEFLIST <length>               giving its name, load address, execution
+#                                  address and length, separated by tabs.
+
+commands = {"T2UEF": 0, "T2INF": 1, "UEF2INF": 1, "T2LIST": 0, "UEFLIST": 0}
+
+# The longest request line accepted.
+MAX_LINE = 256
+
+# The time allowed for a client to send each part of its request.
+TIMEOUT = 60
+
+
+def listing(entries):
+
+    lines = []
+    for entry in entries:
+        lines.append("%s\t%X\t%X\t%X\n" % (entry.name, entry.load,
+                                           entry.exec_addr, entry.length))
+
+    return string.join(lines, "")
+
+
+def perform(command, options, data):
+
+    # Perform a conversion of the input data in a worker process and return
+    # the output, compressing it on a single thread as the workers already
+    # occupy the processors. Exceptions are passed back to the server.
+
+    f = StringIO(data)
+    out = StringIO()
+
+    if command == "T2UEF":
+        convert.t2_to_uef(f, out, compress = "-c" in options, threads = 1)
+    elif command == "T2INF":
+        convert.t2_to_inf(f, out, format = options[0])
+    elif command == "UEF2INF":
+        convert.uef_to_inf(f, out, format = options[0])
+    elif command == "T2LIST":
+        return listing(catalog.build(convert.t2_blocks(f, headers_only = 1)))
+    else:
+        return listing(catalog.build(convert.uef_blocks(f, headers_only = 1)))
+
+    return out.getvalue()
+
+
+def parse_request(line, max_size):
+
+    # Return the command, options and input length given in a request line,
+    # raising ValueError if the request cannot be performed.
+
+    words = string.split(line)
+    if len(words) < 2 or not commands.has_key(words[0]):
+        raise ValueError("Unknown request")
+
+    command = words[0]
+    options = words[1:-1]
+
+    if commands[command] == 1:
+        if len(options) != 1 or not sinks.formats.has_key(options[0]) or \
+           options[0] == "dir":
+            raise ValueError("The output format must be tar, tgz or zip")
+    elif options not in ([], ["-c"]) or (options and command != "T2UEF"):
+        raise ValueError("Unknown options: %s" % string.join(options))
+
+    try:
+        length = int(words[-1])
+        if length < 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError("Invalid length: %s" % words[-1])
+
+    if length > max_size:
+        raise ValueError("The input is larger than %i bytes" % max_size)
+
+    return command, options, length
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+
+    timeout = TIMEOUT
+
+    def handle(self):
+
+        server = self.server
+
+        try:
+            line = self.rfile.readline(MAX_LINE)
+            if not line.endswith("\n"):
+                return
+
+            try:
+                command, options, length = parse_request(line, server.max_size)
+            except ValueError, e:
+                self.reply_error(str(e))
+                return
+
+            data = self.rfile.read(length)
+            if len(data) != length:
+                return
+
+            # Wait for a place in the queue of conversions, so that clients
+            # are held back while the workers are busy
+            server.queue.acquire()
+            try:
+                result = server.pool.apply_async(perform, (command, options, data))
+                del data
+                try:
+                    output = result.get()
+                except Exception, e:
+                    message = str(e)
+                    if message == "":
+                        message = e.__class__.__name__
+                    self.reply_error(message)
+                    return
+            finally:
+                server.queue.release()
+
+            self.wfile.write("OK %i\n" % len(output))
+            self.wfile.write(output)
+
+        except (socket.error, socket.timeout):
+            # The client has gone away or stopped sending
+            pass
+
+    def reply_error(self, message):
+
+        self.wfile.write("ERROR %s\n" % string.replace(message, "\n", " "))
+
+
+class ConvertServer(SocketServer.ThreadingMixIn):
+
+    # Handles each client on its own thread, limiting the number of clients
+    # connected at once, and performs the conversions in a pool of processes,
+    # limiting the number of conversions queued for it. Clients beyond the
+    # limit are told that the server is busy.
+
+    daemon_threads = 1
+    allow_reuse_address = 1
+
+    def setup(self, pool, clients, queued, max_size):
+
+        self.pool = pool
+        self.clients = threading.BoundedSemaphore(clients)
+        self.queue = threading.BoundedSemaphore(queued)
+        self.max_size = max_size
+
+    def process_request(self, request, client_address):
+
+        if not self.clients.acquire(0):
+            try:
+                request.sendall("ERROR The server is busy\n")
+            except socket.error:
+                pass
+            self.shutdown_request(request)
+            return
+
+        # Give the client's place back if its thread cannot be started
+        try:
+            SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+        except:
+            self.clients.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+
+        try:
+            SocketServer.ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            self.clients.release()
+
+
+class UnixServer(ConvertServer, SocketServer.UnixStreamServer):
+    pass
+
+
+class TCPServer(ConvertServer, SocketServer.TCPServer):
+    pass
+
+
+def remove_stale_socket(path):
+
+    # Remove a socket left behind by a server which is no longer running,
+    # leaving any other file in place.
+
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise IOError("The file is not a socket: %s" % path)
+    except OSError:
+        return
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            s.connect(path)
+        except socket.error, e:
+            if e.args[0] in (errno.ECONNREFUSED, errno.ENOENT):
+                os.remove(path)
+                return
+            raise
+    finally:
+        s.close()
+
+    raise IOError("A server is already using the socket: %s" % path)
+
+
+def request(address, command, data, options = ()):
+
+    # Send a request to a server at the given socket path, or (host, port)
+    # pair, and return the output, raising IOError if it fails.
+
+    if isinstance(address, basestring):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    try:
+        try:
+            s.connect(address)
+        except socket.error, e:
+            raise IOError("Failed to connect to the server: %s" % e)
+
+        # The server may refuse the request before reading the input, so
+        # read its response even if the input cannot be sent
+        try:
+            s.sendall(string.join([command] + list(options) + [str(len(data))]) + "\n")
+            s.sendall(data)
+        except socket.error:
+            pass
+
+        f = s.makefile("rb")
+        words = string.split(f.readline(MAX_LINE), None, 1)
+
+        if words[:1] == ["OK"]:
+            output = f.read(int(words[1]))
+            if len(output) == int(words[1]):
+                return output
+            raise IOError("The response was incomplete")
+        elif words[:1] == ["ERROR"]:
+            raise IOError(string.strip(words[1]))
+        else:
+            raise IOError("The response could not be read")
+    finally:
+        s.close()
+
+
+def ignore_interrupts():
+
+    # Leave the server to handle interrupts, so that the workers are not
+    # interrupted in the middle of a conversion.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+if __name__ == "__main__":
+
+    syntax = "[-j <processes>] [--clients <clients>] [--queue <conversions>] " \
+             "[--max-size <bytes>] [--tcp] <address>"
+
+    match = cmdline.match(syntax, sys.argv[1:])
+
+    if match is None:
+
+        import cmdsyntax
+
+        style = cmdsyntax.Style()
+        style.expand_single = 0
+        style.allow_single_long = 1
+
+        if style.verify() == 0:
+
+            sys.stderr.write("Internal problem: syntax style is inconsistent.\n")
+            sys.exit(1)
+
+        syntax_obj = cmdsyntax.Syntax(syntax, style)
+
+        matches, failed = syntax_obj.get_args(sys.argv[1:], style = style, return_failed = 1)
+
+        if len(matches) > 0:
+            match = matches[0]
+
+    if match == {} or match is None:
+
+        sys.stderr.write("Syntax: ConvertServer.py %s\n\n" % syntax)
+        sys.stderr.write("ConvertServer version %s\n\n" % version)
+        sys.stderr.write("Listen for conversion requests on the Unix socket given by <address>, or on\n")
+        sys.stderr.write("the local TCP port given by <address> if --tcp is specified, and perform\n")
+        sys.stderr.write("them using a pool of processes. Each request is a line containing one of\n")
+        sys.stderr.write("the following commands and the length of the input file, followed by the\n")
+        sys.stderr.write("contents of the input file:\n\n")
+        sys.stderr.write("T2UEF [-c] <length>     Convert a T2 file to a UEF file, compressed if -c is\n")
+        sys.stderr.write("                        given.\n")
+        sys.stderr.write("T2INF <format> <length>\n")
+        sys.stderr.write("UEF2INF <format> <length>\n")
+        sys.stderr.write("                        Extract the files in a T2 or UEF file to a tar, tgz\n")
+        sys.stderr.write("                        or zip archive.\n")
+        sys.stderr.write("T2LIST <length>\n")
+        sys.stderr.write("UEFLIST <length>        List the name, load and execution addresses and\n")
+        sys.stderr.write("                        length of each file in a T2 or UEF file.\n\n")
+        sys.stderr.write("The response is a line containing OK and the length of the output, followed\n")
+        sys.stderr.write("by the output, or a line containing ERROR and a message.\n\n")
+        sys.stderr.write("The options perform the following functions:\n\n")
+        sys.stderr.write("-j <processes>          Use the given number of processes (default: one for\n")
+        sys.stderr.write("                        each processor).\n")
+        sys.stderr.write("--clients <clients>     Serve at most this many clients at once, telling\n")
+        sys.stderr.write("                        any others that the server is busy (default: 64).\n")
+        sys.stderr.write("--queue <conversions>   Hold back clients while this many conversions are\n")
+        sys.stderr.write("                        waiting or in progress (default: twice the number\n")
+        sys.stderr.write("                        of processes).\n")
+        sys.stderr.write("--max-size <bytes>      Refuse input files larger than this (default: 16MB).\n")
+        sys.stderr.write("--tcp                   Listen on a TCP port on the local host.\n\n")
+        sys.exit(1)
+
+    import multiprocessing
+
+    try:
+        if match.has_key("j"):
+            processes = int(match["processes"])
+        else:
+            processes = multiprocessing.cpu_count()
+
+        if match.has_key("clients"):
+            clients = int(match["clients"])
+        else:
+            clients = 64
+
+        if match.has_key("queue"):
+            queued = int(match["conversions"])
+        else:
+            queued = 2 * processes
+
+        if match.has_key("max-size"):
+            max_size = int(match["bytes"])
+        else:
+            max_size = 16 << 20
+
+        if min(processes, clients, queued, max_size) < 1:
+            raise ValueError
+
+        if match.has_key("tcp"):
+            port = int(match["address"])
+
+    except ValueError:
+        sys.stderr.write("The limits and port number must be valid numbers.\n")
+        sys.exit(1)
+
+    # Start the workers before any threads are created
+    pool = multiprocessing.Pool(processes, ignore_interrupts)
+
+    try:
+        if match.has_key("tcp"):
+            server = TCPServer(("127.0.0.1", port), RequestHandler)
+        else:
+            remove_stale_socket(match["address"])
+            server = UnixServer(match["address"], RequestHandler)
+    except (IOError, OSError, socket.error), e:
+        pool.terminate()
+        sys.stderr.write("Failed to listen on %s: %s\n" % (match["address"], e))
+        sys.exit(1)
+
+    server.setup(pool, clients, queued, max_size)
+
+    # Stop cleanly when terminated or interrupted. The signal handler runs on
+    # the thread serving requests, which shutdown waits for, so the server is
+    # shut down from another thread instead of interrupting this one.
+    def terminate(signum, frame):
+        thread = threading.Thread(target = server.shutdown)
+        thread.setDaemon(1)
+        thread.start()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        pool.terminate()
+        pool.join()
+        if not match.has_key("tcp"):
+            try:
+                os.remove(match["address"])
+            except OSError:
+                pass
+
+    # Exit
+    sys.exit()
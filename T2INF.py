@@ -20,82 +20,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import sys, string, os
-import cmdsyntax
-
-def read_block(in_f):
-
-    global eof
-    
-    # Read the alignment character
-    align = in_f.read(1)
-
-    if not align:
-        eof = 1
-        return ("", 0, 0, "", 0)
-
-    align = ord(align)^90
-
-    if align == 0x2b:
-        eof = 1
-        return ("", 0, 0, "", 0)
-
-    # Default file attributes
-    name = ""
-    load = 0
-    exec_addr = 0
-    
-    while 1:
-        c = in_f.read(1)
-        if not c:
-            eof = 1
-            return (name, 0, 0, "", 0)
-
-        c = chr(ord(c)^90)
-
-        if ord(c) == 0:
-            break
-
-        name = name + c
-
-
-    load = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)+((ord(in_f.read(1))^90) << 16)+((ord(in_f.read(1))^90) << 24)
-
-    exec_addr = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)+((ord(in_f.read(1))^90) << 16)+((ord(in_f.read(1))^90) << 24)
-
-    block_number = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)
-
-    if verbose == 1:
-        if block_number == 0:
-            print
-            print name,
-        print string.upper(hex(block_number)[2:]),
-
-    block_length = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)
-
-    if block_length==0:
-        return (name, load, exec_addr, "", block_number)
-    
-    block_flag = ord(in_f.read(1))
-
-    next_addr = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)
-
-    header_crc = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)
-
-    in_f.seek(2, 1)
-
-    if list_files == 0:
-        block = ""
-        for i in range(0,block_length):
-            byte = ord(in_f.read(1)) ^ 90
-            block = block + chr(byte)
-    else:
-        in_f.seek(block_length, 1)
-        block = ""
-    
-    block_crc = (ord(in_f.read(1))^90)+((ord(in_f.read(1))^90) << 8)
-    
-    return (name, load, exec_addr, block, block_number)
-
+import cmdline
+import catalog, convert, sinks, stats, streams, t2file
 
 def get_leafname(path):
 
@@ -109,36 +35,47 @@ def get_leafname(path):
 if __name__ == "__main__":
 
     version = "0.14c (Fri 3rd May 2002)"
-    syntax = "(-l [-v] <tape file>) | ([-name <stem>] [-v] <tape file> <destination path>)"
+    syntax = "(-l [-v] [--verify] [--catalog] [--select <file names>] [-j <processes>] " + streams.SYNTAX + " " + stats.SYNTAX + " <tape file>) | " \
+             "([-name <stem>] [-v] [--verify] [--format <output format>] [--store <store directory>] [--select <file names>] [-j <processes>] " + streams.SYNTAX + " " + \
+             stats.SYNTAX + " <tape file> <destination path>)"
     
-    style = cmdsyntax.Style()
-    style.expand_single = 0
-    style.allow_single_long = 1
+    # Parse the arguments without loading cmdsyntax if possible, only using it,
+    # and possibly a GUI, when they cannot be parsed
     
-    if style.verify() == 0:
+    match = cmdline.match(syntax, sys.argv[1:])
     
-        sys.stderr.write("Internal problem: syntax style is inconsistent.\n")
-        sys.exit(1)
+    if match is None:
+    
+        import cmdsyntax
+    
+        style = cmdsyntax.Style()
+        style.expand_single = 0
+        style.allow_single_long = 1
+    
+        if style.verify() == 0:
+    
+            sys.stderr.write("Internal problem: syntax style is inconsistent.\n")
+            sys.exit(1)
     
-    # Create a syntax object.
-    syntax_obj = cmdsyntax.Syntax(syntax, style)
+        # Create a syntax object.
+        syntax_obj = cmdsyntax.Syntax(syntax, style)
     
-    matches, failed = syntax_obj.get_args(sys.argv[1:], style = style, return_failed = 1)
+        matches, failed = syntax_obj.get_args(sys.argv[1:], style = style, return_failed = 1)
     
-    if matches == [] and cmdsyntax.use_GUI() != None:
+        if matches == [] and cmdsyntax.use_GUI() != None:
     
-        form = cmdsyntax.Form("T2UEF", syntax_obj, failed[0])
+            form = cmdsyntax.Form("T2UEF", syntax_obj, failed[0])
         
-        matches = form.get_args()
+            matches = form.get_args()
     
-    # Take the first match.
-    if len(matches) > 0:
+        # Take the first match.
+        if len(matches) > 0:
     
-        match = matches[0]
+            match = matches[0]
     
-    else:
+        else:
     
-        match = None
+            match = None
     
     # If there are no macthes then print the help text.
     if match == {} or match is None:
@@ -154,20 +91,33 @@ if __name__ == "__main__":
         sys.stderr.write("-l              Lists the names of the files as they are extracted.\n")
         sys.stderr.write("-name <stem>    Writes files without names in the format <stem><number>\n")
         sys.stderr.write("                with <number> starting at 1.\n")
-        sys.stderr.write("-v              Verbose output.\n\n")
+        sys.stderr.write("-v              Verbose output.\n")
+        sys.stderr.write("--verify        Check the CRC of each block and report corrupt blocks.\n")
+        sys.stderr.write("--catalog       Lists the files using a catalog stored alongside the input\n")
+        sys.stderr.write("                file, creating it if it is missing or out of date. The\n")
+        sys.stderr.write("                catalog is not used with -v or --verify.\n")
+        sys.stderr.write("--format <output format>\n")
+        sys.stderr.write("                Writes the files to a directory (dir, the default) or to a\n")
+        sys.stderr.write("                tar, tgz or zip archive. A tar archive is written to the\n")
+        sys.stderr.write("                standard output if <destination path> is -.\n")
+        sys.stderr.write("--store <store directory>\n")
+        sys.stderr.write("                Keeps one copy of each distinct file in the store directory\n")
+        sys.stderr.write("                and writes hard links to the copies to the destination.\n")
+        sys.stderr.write("--select <file names>\n")
+        sys.stderr.write("                Only extracts or lists the files with names matching those\n")
+        sys.stderr.write("                given, separated by spaces, which may contain the wildcards\n")
+        sys.stderr.write("                * and ? and are not case-sensitive.\n")
+        sys.stderr.write("-j <processes>  Finds the blocks first and then decodes them, checking them\n")
+        sys.stderr.write("                if --verify is given, using the given number of processes.\n")
+        sys.stderr.write("                Files which are only listed are not decoded.\n")
+        for line in streams.HELP:
+            sys.stderr.write(line + "\n")
+        sys.stderr.write("\n")
+        for line in stats.HELP:
+            sys.stderr.write(line + "\n")
+        sys.stderr.write("\n")
         sys.exit(1)
     
-    # Determine the platform on which the program is running
-    
-    sep = os.sep
-    
-    if sys.platform == "RISCOS":
-        suffix = "/"
-    elif sys.platform == "DOS":
-        suffix = "."
-    else:
-        suffix = "."
-    
     # List files
     if match.has_key("l"):
         list_files = 1
@@ -181,6 +131,32 @@ if __name__ == "__main__":
     else:
         verbose = 0
     
+    # Check block CRCs
+    if match.has_key("verify"):
+        verify = 1
+    else:
+        verify = 0
+    
+    # Output format
+    if match.has_key("format"):
+        format = string.lower(match["output format"])
+    else:
+        format = "dir"
+    
+    if not sinks.formats.has_key(format):
+        sys.stderr.write("Unknown output format: %s\n" % format)
+        sys.exit(1)
+    
+    if not list_files and verbose and match["destination path"] == "-":
+        sys.stderr.write("Verbose output cannot be used when writing to standard output.\n")
+        sys.exit(1)
+    
+    # Content-addressed store for extracted files
+    if match.has_key("store"):
+        store = match["store directory"]
+    else:
+        store = None
+    
     # Stem for unknown filenames
     if match.has_key("name"):
     
@@ -188,18 +164,91 @@ if __name__ == "__main__":
     else:
         stem = "noname"
     
+    # Number of processes used to decode the blocks
+    if match.has_key("j"):
+        try:
+            processes = int(match["processes"])
+            if processes < 1:
+                raise ValueError
+        except ValueError:
+            sys.stderr.write("The number of processes must be a positive number.\n")
+            sys.exit(1)
+    else:
+        processes = 1
+    
+    # Memory limit for reading the input as a stream
+    try:
+        limit = streams.from_match(match)
+    except ValueError, e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+    
+    if limit is not None and processes > 1:
+        sys.stderr.write("The -j and --stream options cannot be used together.\n")
+        sys.exit(1)
+    
+    # Names or glob patterns of the files to extract
+    if match.has_key("select"):
+        select = string.split(match["file names"])
+    else:
+        select = None
+    
     # Read the input file name.
     in_file = match["tape file"]
     
+    # List the files using the catalog, creating it if necessary
+    if list_files and match.has_key("catalog") and not verbose and not verify:
+    
+        if limit is None:
+            read = lambda: convert.t2_blocks(in_file, headers_only = 1)
+        else:
+            read = lambda: convert.t2_stream(in_file, limit)
+    
+        try:
+            entries = catalog.entries(in_file, read)
+        except (IOError, ValueError), e:
+            sys.stderr.write("%s\n" % e)
+            sys.exit(1)
+    
+        for entry in entries:
+            if entry.first == 0:
+                if select is None or convert.matches(entry.name, select):
+                    print entry.name
+    
+        sys.exit()
+    
     
-    # Open the input file
+    # Collect statistics if required, timing each stage of the conversion
+    measure = stats.from_match("T2INF", match)
+    
+    read_t2 = convert.read_t2
+    t2_stream = convert.t2_stream
+    write_files = convert.write_files
+    if measure is not None:
+        read_t2 = measure.call("read", read_t2)
+        t2_stream = measure.call("read", t2_stream)
+        write_files = measure.exclusive("write", write_files)
+    
+    # Read the input file, or open it to be read as a stream
     try:
-        in_f = open(in_file, "rb")
-    except IOError:
-        sys.stderr.write('The input file could not be found: %s\n' % in_file)
+        if limit is None:
+            data = read_t2(in_file)
+        else:
+            data = None
+            stream = t2_stream(in_file, limit)
+    except IOError, e:
+        sys.stderr.write("%s\n" % e)
         sys.exit(1)
     
+    # Check that the output can be written before creating any directory
     if list_files == 0:
+        try:
+            sinks.check_sink(out_path, format, store)
+        except ValueError, e:
+            sys.stderr.write("%s\n" % e)
+            sys.exit(1)
+    
+    if list_files == 0 and format == "dir":
     
         # Get the leafname of the output path
         leafname = get_leafname(out_path)
@@ -215,131 +264,66 @@ if __name__ == "__main__":
                 sys.stderr.write('Directory already exists: %s\n' % leafname)
                 sys.exit(1)
     
-    in_f.seek(5, 1)        # Move to byte 5 in the T2 file
-    
-    eof = 0                # End of file flag
-    out_file = ""          # Currently open file as specified in the block
-    write_file = ""        # Write the file using this name
-    file_length = 0        # File length
-    first_file = 1
-    
-    # List of files already created
-    created = []
-    
-    # Unnamed file counter
-    n = 1
+    if list_files == 0:
     
-    while 1:
-        # Read block details
+        # Open the directory or archive to write the files to
         try:
-            name, load, exec_addr, block, block_number = read_block(in_f)
-        except IOError:
-            sys.stderr.write("Unexpected end of file\n")
+            sink = sinks.open_sink(out_path, format, store)
+        except (IOError, OSError, ValueError), e:
+            sys.stderr.write("%s\n" % e)
             sys.exit(1)
     
-        if list_files == 0:
-            # Not listing the filenames
-    
-            if eof == 1:
-                # Close the current output file
-                out.close()
-        
-                # Write the file length information to the relevant file
-                inf.write(string.upper(hex(file_length)[2:]+"\n"))
-                inf.close()
-                break
-        
-        #    # Either force new file or name in block is not the current name used
-        #    if (write_file=="") | (name != out_file):
-        #
-        #        # New file, so close the last one (if there was one)
-        #        if write_file != "":
-        #            # Close the current output file
-        #            out.close()
-        #
-        #            # Write the file length information to the relevant file
-        #            inf.write(string.upper(hex(file_length)[2:]+"\n"))
-        #            inf.close()
-        
-            # New file (block number is zero) or no previous file
-            if (block_number == 0) | (first_file == 1):
-        
-                # Set the new name of the file
-                out_file = name
-                write_file = name
-        
-                # Open the new file with the new name
-        
-                if (write_file in created):
-                    write_file = write_file+"-"+str(n)
-                    n = n + 1
-        
-                if (write_file == ""):
-                    write_file = stem+str(n)
-                    n = n + 1
-        
-                # New file, so close the last one (if there was one)
-                if first_file == 0:
-                    # Close the previous output file
-                    out.close()
-        
-                    # Write the file length information and the NEXT parameter
-                    # to the previous .inf file
-                    inf.write(string.upper(hex(file_length)[2:]+"\tNEXT $."+write_file+"\n"))
-                    inf.close()
-                else:
-                    first_file = 0
-    
-                # Reset the file length
-                file_length = 0
-    
-                try:
-                    out = open(out_path + sep + write_file, "wb")
-                except IOError:
-                    # Couldn't open the file
-                    write_file = stem+str(n)
-                    n = n + 1
-                    try:
-                        out = open(out_path + sep + write_file, "wb")
-                    except IOError:
-                        sys.stderr.write('Failed to open the file: %s\n' % (
-                                out_path + sep + write_file))
-                        sys.exit(1)
-        
-                # Add file to the list of created files
-                created.append(write_file)
-        
-                try:
-                    # Open information file
-                    inf = open(out_path + sep + write_file + suffix + "inf", "w")
-                except IOError:
-                    sys.stderr.write('Failed to open the information file: %s\n' % (
-                            out_path + sep + write_file + suffix + "inf"))
-                    sys.exit(1)
-        
-                # Write the load and execution information to the relevant file
-                inf.write( "$." + write_file + "\t" + string.upper(hex(load)[2:])+\
-                           "\t" + string.upper(hex(exec_addr)[2:]) + "\t" )
-        
+    summary = convert.new_summary()
+    
+    # Only the block headers are needed to list the files, and to find the
+    # files selected before decoding them
+    if limit is not None and select is None:
+        blocks = stream
+    elif limit is not None:
+        blocks = convert.select_blocks(stream, select)
+    elif select is None and list_files and not verify:
+        blocks = t2file.read_blocks(data, headers_only = 1)
+    elif select is None and processes > 1:
+        blocks = t2file.read_blocks_parallel(data, processes, verify)
+    elif select is None:
+        blocks = t2file.read_blocks(data)
+    elif list_files and not verify:
+        blocks = convert.select_blocks(t2file.read_blocks(data, headers_only = 1), select)
+    elif processes > 1:
+        headers = convert.select_blocks(t2file.read_blocks(data, headers_only = 1), select)
+        blocks = t2file.read_blocks_parallel(data, processes, verify, headers = headers)
+    else:
+        blocks = convert.t2_selected(data, select)
+    if measure is not None:
+        blocks = measure.iterate("decode", blocks)
+    blocks = convert.monitor(blocks, summary, verbose, verify, measure)
     
-            if block != "":
-        
-                # Write the block to the relevant file
-                out.write(block)
-        
-                file_length = file_length + len(block)
+    try:
+        if list_files == 0:
+            # Write the files and their .inf files
+            write_files(blocks, sink, stem, summary, measure)
+            if measure is not None:
+                measure.call("write", sink.close)()
+            else:
+                sink.close()
+    
+            if store is not None:
+                print "Stored %i new files and linked %i duplicates." % (
+                    sink.stored, sink.linked)
         else:
             # Listing the filenames
-            if eof == 1:
-                break
-    
-            if (verbose == 0) & (block_number == 0):
-                print name
-    
-    
+            for block in blocks:
+                if (verbose == 0) & (block.number == 0):
+                    print block.name
+    except IOError, e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
     
-    # Close the input file
-    in_f.close()
+    if measure is not None:
+        if data is not None:
+            measure.count("input bytes", len(data))
+        measure.counts(summary)
+        measure.finish()
     
     # Exit
     sys.exit()
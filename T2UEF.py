@@ -18,136 +18,43 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import gzip, os, string, sys
-import cmdsyntax
-
-def number(size, n):
-
-    # Little endian writing
-
-    s = ""
-
-    while size > 0:
-        i = n % 256
-        s = s + chr(i)
-#        n = n / 256
-        n = n >> 8
-        size = size - 1
-
-    return s
-
-
-def chunk(f, n, data):
-
-    # Chunk ID
-    f.write(number(2, n))
-    # Chunk length
-    f.write(number(4, len(data)))
-    # Data
-    f.write(data)
-
-
-def decode(s):
-
-    new = ""
-
-    for i in s:
-        new = new + chr(ord(i)^90)
-
-    return new
-
-
-def read_block(in_f):
-
-    block = ""
-    gap = 0
-
-    # Read the alignment character
-    align = in_f.read(1)
-
-    if not align:
-        return "", 0
-
-    block = block + chr(ord(align)^90)
-
-    # Read the name
-
-    while 1:
-        c = in_f.read(1)
-        if not c:
-            return block, 0
-
-        c = chr(ord(c)^90)
-
-        block = block + c
-
-        if ord(c) == 0:
-            break
-
-
-    # Load address
-    block = block + decode(in_f.read(4))
-
-    # Execution address
-    block = block + decode(in_f.read(4))
-
-    # Block number
-    block = block + decode(in_f.read(2))
-
-    block_number = ord(block[-2])+(ord(block[-1]) << 8)
-    if block_number == 0:
-        gap = 1
-
-    # Block length
-    block = block + decode(in_f.read(2))
-
-    block_length = ord(block[-2])+(ord(block[-1]) << 8)
-
-    # Block flag
-    block = block + decode(in_f.read(1))
-
-    # Next address
-    block = block + decode(in_f.read(2))
-
-    block = block + decode(in_f.read(2))
-
-    # Header CRC
-    block = block + decode(in_f.read(2))
-
-    if block_length==0:
-        return block, 0
-    
-    block = block + decode(in_f.read(block_length))
-
-    # Block CRC
-    block = block + decode(in_f.read(2))
-
-    return block, gap
-
+import sys
+import cmdline
+import convert, gzipwriter, stats, streams, t2file
 
 if __name__ == "__main__":
 
-    syntax = "[-c] <Tape file> <UEF file>"
+    syntax = "[-c] [--level <compression level>] [--verify] [-j <processes>] " + streams.SYNTAX + " " + stats.SYNTAX + \
+             " <Tape file> <UEF file>"
     version = "0.15c (Tue 15th April 2003)"
     
-    syntax_obj = cmdsyntax.Syntax(syntax)
+    # Parse the arguments without loading cmdsyntax if possible, only using it,
+    # and possibly a GUI, when they cannot be parsed
+    
+    match = cmdline.match(syntax, sys.argv[1:])
     
-    matches, failed = syntax_obj.get_args(sys.argv[1:], return_failed = 1)
+    if match is None:
     
-    if matches == [] and cmdsyntax.use_GUI() != None:
+        import cmdsyntax
     
-        form = cmdsyntax.Form("T2UEF", syntax_obj, failed[0])
+        syntax_obj = cmdsyntax.Syntax(syntax)
+    
+        matches, failed = syntax_obj.get_args(sys.argv[1:], return_failed = 1)
+    
+        if matches == [] and cmdsyntax.use_GUI() != None:
+    
+            form = cmdsyntax.Form("T2UEF", syntax_obj, failed[0])
         
-        matches = form.get_args()
+            matches = form.get_args()
     
-    # Take the first match.
-    if len(matches) > 0:
+        # Take the first match.
+        if len(matches) > 0:
     
-        match = matches[0]
+            match = matches[0]
     
-    else:
+        else:
     
-        match = None
+            match = None
     
     if match == {} or match is None:
     
@@ -156,92 +63,122 @@ if __name__ == "__main__":
         sys.stderr.write("Take the files stored in the T2* file given and store them in the UEF file\n")
         sys.stderr.write("specified as tape files.\n\n")
         sys.stderr.write("If the -c flag is specified then the UEF file will be compressed in the form\n")
-        sys.stderr.write("understood by gzip.\n\n")
+        sys.stderr.write("understood by gzip. The --level option selects the compression level, from 1\n")
+        sys.stderr.write("(fastest) to 9 (smallest, the default), and implies -c.\n\n")
+        sys.stderr.write("If the --verify flag is specified then the CRC of each block is checked and\n")
+        sys.stderr.write("corrupt blocks are reported.\n\n")
+        sys.stderr.write("If the -j option is specified then the blocks are found first and then\n")
+        sys.stderr.write("decoded, and checked if --verify is given, using the given number of\n")
+        sys.stderr.write("processes.\n\n")
+        for line in streams.HELP:
+            sys.stderr.write(line + "\n")
+        sys.stderr.write("\n")
+        sys.stderr.write("The options for measuring the conversion are:\n\n")
+        for line in stats.HELP:
+            sys.stderr.write(line + "\n")
+        sys.stderr.write("\n")
         sys.exit(1)
     
     # Determine whether the file needs to be compressed
     
     compress = match.has_key("c")
     
-    # Read the input and output file names.
-    
-    t2_file = match["Tape file"]
-    uef_file = match["UEF file"]
-    
-    try:
-        t2 = open(t2_file, "rb")
-    except:
-        sys.stderr.write("Failed to open the tape file: %s\n" % t2_file)
-        sys.exit(1)
-    
-    # Create the UEF file
+    # Determine the compression level
     
-    try:
-        if compress:
-            uef = gzip.open(uef_file, "wb")
-        else:
-            uef = open(uef_file, "wb")
-    except:
-        sys.stderr.write("Failed to open the UEF file: %s\n" % uef_file)
-        sys.exit(1)
+    if match.has_key("level"):
     
-    # Write the UEF file header
+        try:
+            level = int(match["compression level"])
+            if level < 1 or level > 9:
+                raise ValueError
+        except ValueError:
+            sys.stderr.write("The compression level must be a number from 1 to 9.\n")
+            sys.exit(1)
     
-    uef.write("UEF File!\000")
+        compress = 1
+    else:
+        level = gzipwriter.DEFAULT_LEVEL
     
-    # Minor and major version numbers
+    # Determine whether the block CRCs are checked
     
-    uef.write(number(1, 6) + number(1, 0))
+    verify = match.has_key("verify")
     
-    # Begin writing chunks
+    # Determine the number of processes used to decode the blocks
     
-    # Creator chunk
+    if match.has_key("j"):
     
-    we_are = "T2UEF "+version+"\000"
-    if (len(we_are) % 4) != 0:
-        we_are = we_are + ("\000"*(4-(len(we_are) % 4)))
+        try:
+            processes = int(match["processes"])
+            if processes < 1:
+                raise ValueError
+        except ValueError:
+            sys.stderr.write("The number of processes must be a positive number.\n")
+            sys.exit(1)
+    else:
+        processes = 1
     
-    # Write this program's details
-    chunk(uef, 0, we_are)
+    # Determine whether the input is read as a stream
     
-    # Platform chunk
-    chunk(uef, 5, number(1, 1))    # Electron with any keyboard layout
+    try:
+        limit = streams.from_match(match)
+    except ValueError, e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
     
-    # Specify tape chunks
-    chunk(uef, 0x110, number(2,0x05dc))
-    chunk(uef, 0x100, number(1,0xdc))
+    if limit is not None and processes > 1:
+        sys.stderr.write("The -j and --stream options cannot be used together.\n")
+        sys.exit(1)
     
-    # Decode the T2* file
-    t2.seek(5, 1)        # Move to byte 5 in the file
+    # Read the input and output file names.
     
-    # chunk(uef, 0x110, number(2,0x05dc))
+    t2_file = match["Tape file"]
+    uef_file = match["UEF file"]
     
-    while 1:
-        # Read block details
-        block, gap = read_block(t2)
+    # Collect statistics if required, timing each stage of the conversion
     
-        if block == "":
-            break
+    measure = stats.from_match("T2UEF", match)
     
-        # If this is the first block in a file then put in a long gap before it
-        # - the preceding program may need time to complete running before it
-        # attempts to load the next one
+    read_t2 = convert.read_t2
+    t2_stream = convert.t2_stream
+    write_uef = convert.write_uef
+    if measure is not None:
+        read_t2 = measure.call("read", read_t2)
+        t2_stream = measure.call("read", t2_stream)
+        write_uef = measure.exclusive("write", write_uef)
     
-        if gap == 1:
-            chunk(uef, 0x110, number(2,0x05dc))
+    try:
+        if limit is None:
+            data = read_t2(t2_file)
         else:
-            chunk(uef, 0x110, number(2,0x0258))
+            data = None
+            blocks = t2_stream(t2_file, limit)
+    except IOError:
+        sys.stderr.write("Failed to open the tape file: %s\n" % t2_file)
+        sys.exit(1)
+    
+    # Decode the T2* file and write the blocks to the UEF file
     
-        # Write the block to the UEF file
-        chunk(uef, 0x100, block)
+    summary = convert.new_summary()
+    if limit is None and processes > 1:
+        blocks = t2file.read_blocks_parallel(data, processes, verify)
+    elif limit is None:
+        blocks = t2file.read_blocks(data)
+    if measure is not None:
+        blocks = measure.iterate("decode", blocks)
+    blocks = convert.monitor(blocks, summary, verify = verify, stats = measure)
     
-    # Write some finishing bytes to the file
-    chunk(uef, 0x110, number(2,0x0258))
-    chunk(uef, 0x112, number(2,0x0258))
+    try:
+        write_uef(blocks, uef_file, compress, level, "T2UEF "+version, summary, measure,
+                  limit)
+    except IOError, e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
     
-    # Close the T2* and UEF files
-    t2.close()
-    uef.close()
+    if measure is not None:
+        if data is not None:
+            measure.count("input bytes", len(data))
+        measure.counts(summary)
+        measure.finish()
     
     # Exit
     sys.exit()
@@ -19,138 +19,8 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import cmdsyntax, sys, string, os, gzip
-
-def str2num(size, s):
-
-    i = 0
-    n = 0
-    while i < size:
-
-        n = n | (ord(s[i]) << (i*8))
-        i = i + 1
-
-    return n
-
-            
-def read_block(in_f):
-
-    global eof
-
-    while eof == 0:
-
-        # Read chunk ID
-        chunk_id = in_f.read(2)
-        if not chunk_id:
-            eof = 1
-            break
-
-        chunk_id = str2num(2, chunk_id)
-
-        if chunk_id == 0x100 or chunk_id == 0x102:
-
-            length = str2num(4, in_f.read(4))
-            if (length > 1):
-                # Read block
-                data = in_f.read(length)
-                break
-            else:
-                in_f.read(length)
-
-        else:
-            # Skip chunk
-            length = str2num(4, in_f.read(4))
-            in_f.read(length)
-
-    if eof == 1:
-        return ("", 0, 0, "", 0)
-
-    # For the implicit tape data chunk, just read the block as a series
-    # of bytes, as before
-    if chunk_id == 0x100:
-
-        block = data
-
-    else:    # 0x102
-
-        if UEF_major == 0 and UEF_minor < 9:
-
-            # For UEF file versions earlier than 0.9, the number of
-            # excess bits to be ignored at the end of the stream is
-            # set to zero implicitly
-            ignore = 0
-            bit_ptr = 0
-        else:
-            # For later versions, the number of excess bits is
-            # specified in the first byte of the stream
-            ignore = data[0]
-            bit_ptr = 8
-
-        # Convert the data to the implicit format
-        block = []
-        write_ptr = 0
-
-        after_end = (len(data)*8) - ignore
-        while bit_ptr < after_end:
-
-            # Skip start bit
-            bit_ptr = bit_ptr + 1
-
-            # Read eight bits of data
-            bit_offset = bit_ptr % 8
-            if bit_offset == 0:
-                # Write the byte to the block
-                block[write_ptr] = data[bit_ptr >> 3]
-            else:
-                # Read the byte containing the first bits
-                b1 = data[bit_ptr >> 3]
-                # Read the byte containing the rest
-                b2 = data[(bit_ptr >> 3) + 1]
-
-                # Construct a byte of data
-                # Shift the first byte right by the bit offset
-                # in that byte
-                b1 = b1 >> bit_offset
-
-                # Shift the rest of the bits from the second
-                # byte to the left and ensure that the result
-                # fits in a byte
-                b2 = (b2 << (8 - bit_offset)) & 0xff
-
-                # OR the two bytes together and write it to
-                # the block
-                block[write_ptr] = b1 | b2
-
-            # Increment the block pointer
-            write_ptr = write_ptr + 1
-
-            # Move the data pointer on eight bits and skip the
-            # stop bit
-            bit_ptr = bit_ptr + 9
-
-    # Read the block
-    name = ""
-    a = 1
-    while 1:
-        c = block[a]
-        if ord(c) != 0: # was > 32:
-            name = name + c
-        a = a + 1
-        if ord(c) == 0:
-            break
-
-    load = str2num(4, block[a:a+4])
-    exec_addr = str2num(4, block[a+4:a+8])
-    block_number = str2num(2, block[a+8:a+10])
-
-    if verbose == 1:
-        if block_number == 0:
-            print
-            print name,
-        print string.upper(hex(block_number)[2:]),
-
-    return (name, load, exec_addr, block[a+19:-2], block_number)
-
+import cmdline, sys, string, os
+import catalog, convert, rebuild, sinks, stats, streams, ueffile
 
 def get_leafname(path):
 
@@ -165,37 +35,48 @@ if __name__ == "__main__":
 
     version = '0.13c (Tue 15th April 2003)'
     
-    style = cmdsyntax.Style()
+    syntax = "(-l [-v] [--verify] [--catalog] [--select <file names>] " + streams.SYNTAX + " " + stats.SYNTAX + " <UEF file>) | " \
+             "([-name <stem>] [-v] [--verify] [--format <output format>] [--store <store directory>] [--manifest <manifest file>] [--select <file names>] " + streams.SYNTAX + " " + \
+             stats.SYNTAX + " <UEF file> <destination path>)"
     
-    style.allow_single_long = 1
-    style.expand_single = 0
+    # Parse the arguments without loading cmdsyntax if possible, only using it,
+    # and possibly a GUI, when they cannot be parsed
     
-    if style.verify() == 0:
+    match = cmdline.match(syntax, sys.argv[1:])
     
-        sys.stderr.write("Internal problem: syntax style is inconsistent.\n")
-        sys.exit(1)
+    if match is None:
+    
+        import cmdsyntax
     
-    syntax = "(-l [-v] <UEF file>) | ([-name <stem>] [-v] <UEF file> <destination path>)"
+        style = cmdsyntax.Style()
     
-    # Create a syntax object.
-    syntax_obj = cmdsyntax.Syntax(syntax, style)
+        style.allow_single_long = 1
+        style.expand_single = 0
+    
+        if style.verify() == 0:
+    
+            sys.stderr.write("Internal problem: syntax style is inconsistent.\n")
+            sys.exit(1)
     
-    matches, failed = syntax_obj.get_args(sys.argv[1:], style = style, return_failed = 1)
+        # Create a syntax object.
+        syntax_obj = cmdsyntax.Syntax(syntax, style)
     
-    if matches == [] and cmdsyntax.use_GUI() != None:
+        matches, failed = syntax_obj.get_args(sys.argv[1:], style = style, return_failed = 1)
     
-        form = cmdsyntax.Form("UEF2INF", syntax_obj, failed[0])
+        if matches == [] and cmdsyntax.use_GUI() != None:
+    
+            form = cmdsyntax.Form("UEF2INF", syntax_obj, failed[0])
         
-        matches = form.get_args()
+            matches = form.get_args()
     
-    # Take the first match.
-    if len(matches) > 0:
+        # Take the first match.
+        if len(matches) > 0:
     
-        match = matches[0]
+            match = matches[0]
     
-    else:
+        else:
     
-        match = None
+            match = None
     
     # If there are no macthes then print the help text.
     if match == {} or match is None:
@@ -210,26 +91,63 @@ if __name__ == "__main__":
         sys.stderr.write("-l              Lists the names of the files as they are extracted.\n")
         sys.stderr.write("-name <stem>    Writes files without names in the format <stem><number>\n")
         sys.stderr.write("                with <number> starting at 1.\n")
-        sys.stderr.write("-v              Verbose output.\n\n")
+        sys.stderr.write("-v              Verbose output.\n")
+        sys.stderr.write("--verify        Check the CRC of each block and report corrupt blocks.\n")
+        sys.stderr.write("--catalog       Lists the files using a catalog stored alongside the input\n")
+        sys.stderr.write("                file, creating it if it is missing or out of date. The\n")
+        sys.stderr.write("                catalog is not used with -v or --verify.\n")
+        sys.stderr.write("--format <output format>\n")
+        sys.stderr.write("                Writes the files to a directory (dir, the default) or to a\n")
+        sys.stderr.write("                tar, tgz or zip archive. A tar archive is written to the\n")
+        sys.stderr.write("                standard output if <destination path> is -.\n")
+        sys.stderr.write("--store <store directory>\n")
+        sys.stderr.write("                Keeps one copy of each distinct file in the store directory\n")
+        sys.stderr.write("                and writes hard links to the copies to the destination.\n")
+        sys.stderr.write("--manifest <manifest file>\n")
+        sys.stderr.write("                Only extracts the files if the UEF file, the options or the\n")
+        sys.stderr.write("                extracted files have changed since the extraction was last\n")
+        sys.stderr.write("                recorded in the manifest file.\n")
+        sys.stderr.write("--select <file names>\n")
+        sys.stderr.write("                Only extracts or lists the files with names matching those\n")
+        sys.stderr.write("                given, separated by spaces, which may contain the wildcards\n")
+        sys.stderr.write("                * and ? and are not case-sensitive.\n")
+        for line in streams.HELP:
+            sys.stderr.write(line + "\n")
+        sys.stderr.write("\n")
+        for line in stats.HELP:
+            sys.stderr.write(line + "\n")
+        sys.stderr.write("\n")
         sys.exit(1)
     
-    # Determine the platform on which the program is running
-    
-    sep = os.sep
-    
-    if sys.platform == "RISCOS":
-        suffix = "/"
-    elif sys.platform == "DOS":
-        suffix = "."
-    else:
-        suffix = "."
-    
     # List files
     list_files = match.has_key('l')
     
     # Verbose output
     verbose = match.has_key('v')
     
+    # Check block CRCs
+    verify = match.has_key('verify')
+    
+    # Output format
+    if match.has_key('format'):
+        format = string.lower(match['output format'])
+    else:
+        format = 'dir'
+    
+    if not sinks.formats.has_key(format):
+        sys.stderr.write("Unknown output format: %s\n" % format)
+        sys.exit(1)
+    
+    if not list_files and verbose and match['destination path'] == '-':
+        sys.stderr.write("Verbose output cannot be used when writing to standard output.\n")
+        sys.exit(1)
+    
+    # Content-addressed store for extracted files
+    if match.has_key('store'):
+        store = match['store directory']
+    else:
+        store = None
+    
     # Stem for unknown filenames
     if match.has_key('name'):
     
@@ -237,33 +155,99 @@ if __name__ == "__main__":
     else:
         stem = 'noname'
     
+    # Names or glob patterns of the files to extract
+    if match.has_key('select'):
+        select = string.split(match['file names'])
+    else:
+        select = None
     
-    # Open the input file
+    # Memory limit for reading the input as a stream
     try:
-        in_f = open(match['UEF file'], "rb")
-    except IOError:
-        sys.stderr.write("The input file could not be found: %s\n" % match['UEF file'])
+        limit = streams.from_match(match)
+    except ValueError, e:
+        sys.stderr.write("%s\n" % e)
         sys.exit(1)
     
-    # Is it gzipped?
-    if in_f.read(10) != "UEF File!\000":
+    # List the files using the catalog, creating it if necessary
+    if list_files and match.has_key('catalog') and not verbose and not verify:
     
-        in_f.close()
-        in_f = gzip.open(match['UEF file'], "rb")
+        if limit is None:
+            read = lambda: convert.uef_blocks(match['UEF file'], headers_only = 1)
+        else:
+            read = lambda: convert.uef_stream(match['UEF file'], limit)
     
         try:
-            if in_f.read(10) != "UEF File!\000":
-                sys.stderr.write("The input file is not a UEF file: %s\n" % match['UEF file'])
-                sys.exit(1)
-        except:
-            sys.stderr.write("The input file could not be read: %s\n" % match['UEF file'])
+            entries = catalog.entries(match['UEF file'], read)
+        except (IOError, ValueError), e:
+            sys.stderr.write("%s\n" % e)
             sys.exit(1)
     
-    # Read version number of the file format
-    UEF_minor = str2num(1, in_f.read(1))
-    UEF_major = str2num(1, in_f.read(1))
+        for entry in entries:
+            if entry.first == 0:
+                if select is None or convert.matches(entry.name, select):
+                    print entry.name
     
+        sys.exit()
+    
+    # Skip the extraction if the manifest shows that nothing has changed
+    manifest = None
+    
+    if list_files == 0 and match.has_key('manifest'):
+    
+        if match['destination path'] == '-':
+            sys.stderr.write("A manifest cannot be used when writing to standard output.\n")
+            sys.exit(1)
+    
+        options = "format=%s stem=%r store=%r" % (format, stem, store)
+        if select is not None:
+            options = options + " select=%r" % select
+        inputs = [os.path.abspath(match['UEF file'])]
+    
+        try:
+            manifest = rebuild.Manifest(match['manifest file'])
+        except ValueError, e:
+            sys.stderr.write("%s\n" % e)
+            sys.exit(1)
+    
+        if manifest.up_to_date(match['destination path'], 'UEF2INF', options,
+                               match['UEF file'], inputs):
+            print "The files are up to date: %s" % match['destination path']
+            sys.exit()
+    
+    # Collect statistics if required, timing each stage of the conversion
+    measure = stats.from_match('UEF2INF', match)
+    
+    read_uef = convert.read_uef
+    uef_stream = convert.uef_stream
+    index_chunks = ueffile.index_chunks
+    write_files = convert.write_files
+    if measure is not None:
+        read_uef = measure.call('read', read_uef)
+        uef_stream = measure.call('read', uef_stream)
+        index_chunks = measure.call('index', index_chunks)
+        write_files = measure.exclusive('write', write_files)
+    
+    # Read the input file, which may be gzipped, and the version number of
+    # the file format, or open it to be read as a stream
+    try:
+        if limit is None:
+            data, UEF_minor, UEF_major = read_uef(match['UEF file'])
+        else:
+            data = None
+            stream = uef_stream(match['UEF file'], limit)
+    except (IOError, ValueError), e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+    
+    # Check that the output can be written before creating any directory
     if list_files == 0:
+        try:
+            sinks.check_sink(match['destination path'], format, store)
+        except ValueError, e:
+            sys.stderr.write("%s\n" % e)
+            sys.exit(1)
+    
+    if list_files == 0 and format == 'dir':
     
         # Get the leafname of the output path
         leafname = get_leafname(match['destination path'])
@@ -279,114 +263,80 @@ if __name__ == "__main__":
                 sys.stderr.write("Directory already exists: %s\n" % leafname)
                 sys.exit(1)
     
-    eof = 0            # End of file flag
-    out_file = ""        # Currently open file as specified in the block
-    write_file = ""        # Write the file using this name
-    file_length = 0        # File length
-    first_file = 1
-    
-    # List of files already created
-    created = []
-    
-    # Unnamed file counter
-    n = 1
-    
+    if list_files == 0:
     
-    while 1:
-        # Read block details
+        # Open the directory or archive to write the files to
         try:
-            name, load, exec_addr, block, block_number = read_block(in_f)
-        except IOError:
-            sys.stderr.write("Unexpected end of file\n")
+            sink = sinks.open_sink(match['destination path'], format, store)
+        except (IOError, OSError, ValueError), e:
+            sys.stderr.write("%s\n" % e)
             sys.exit(1)
     
+    summary = convert.new_summary()
+    
+    if limit is None:
+        index = index_chunks(data)
+    
+    # Only the block headers are needed to list the files, and to find the
+    # chunks containing the files selected before decoding them
+    if limit is not None and select is None:
+        blocks = stream
+    elif limit is not None:
+        blocks = convert.select_blocks(stream, select)
+    elif select is None:
+        blocks = ueffile.read_blocks(data, UEF_minor, UEF_major, index)
+    elif list_files and not verify:
+        blocks = convert.select_blocks(
+            ueffile.read_blocks(data, UEF_minor, UEF_major, index, 1), select)
+    else:
+        blocks = convert.uef_selected(data, UEF_minor, UEF_major, select, index)
+    if measure is not None:
+        blocks = measure.iterate('decode', blocks)
+    blocks = convert.monitor(blocks, summary, verbose, verify, measure)
+    
+    try:
         if list_files == 0:
-            # Not listing the filenames
+            # Write the files and their .inf files
+            write_files(blocks, sink, stem, summary, measure)
+            if measure is not None:
+                measure.call('write', sink.close)()
+            else:
+                sink.close()
     
-            if eof == 1:
-                # Close the current output file
-                out.close()
-        
-                # Write the file length information to the relevant file
-                inf.write(string.upper(hex(file_length)[2:]+"\n"))
-                inf.close()
-                break
-        
-            # New file (block number is zero) or no previous file
-            if (block_number == 0) | (first_file == 1):
-        
-                # Set the new name of the file
-                out_file = name
-                write_file = name
-        
-                # Open the new file with the new name
-        
-                if (write_file in created):
-                    write_file = write_file+"-"+str(n)
-                    n = n + 1
-        
-                if (write_file == ""):
-                    write_file = stem+str(n)
-                    n = n + 1
-    
-                # New file, so close the last one (if there was one)
-                if first_file == 0:
-                    # Close the previous output file
-                    out.close()
-        
-                    # Write the file length information and the NEXT parameter
-                    # to the previous .inf file
-                    inf.write(string.upper(hex(file_length)[2:]+"\tNEXT $."+write_file+"\n"))
-                    inf.close()
-                else:
-                    first_file = 0
+            if store is not None:
+                print "Stored %i new files and linked %i duplicates." % (
+                    sink.stored, sink.linked)
     
-                # Reset the file length
-                file_length = 0
+            # Record the extraction in the manifest
+            if manifest is not None:
+    
+                if format == 'dir':
+                    outputs = sink.paths
+                else:
+                    outputs = [match['destination path']]
     
                 try:
-                    out = open(match['destination path']+sep+write_file, "wb")
-                except IOError:
-                    # Couldn't open the file
-                    write_file = stem+str(n)
-                    n = n + 1
-                    try:
-                        out = open(match['destination path']+sep+write_file, "wb")
-                    except IOError:
-                        sys.stderr.write("Couldn't open the file: %s\n" % (match['destination path']+sep+write_file))
-                        sys.exit(1)
-        
-                # Add file to the list of created files
-                created.append(write_file)
-        
-                try:
-                    inf = open(match['destination path']+sep+write_file+suffix+"inf", "w")    # Open information file
-                except IOError:
-                    sys.stderr.write("Couldn't open the information file: %s\n" % (match['destination path']+sep+write_file+suffix+"inf"))
+                    manifest.record(match['destination path'], 'UEF2INF', options,
+                                    match['UEF file'], inputs, outputs)
+                    manifest.save()
+                except (IOError, OSError):
+                    sys.stderr.write("Failed to write the manifest file: %s\n" % match['manifest file'])
                     sys.exit(1)
-        
-                # Write the load and execution information to the relevant file
-                inf.write("$."+write_file+"\t"+string.upper(hex(load)[2:])+"\t"+string.upper(hex(exec_addr)[2:])+"\t")
-        
-    
-            if block != "":
-        
-                # Write the block to the relevant file
-                out.write(block)
-        
-                file_length = file_length + len(block)
         else:
             # Listing the filenames
-            if eof == 1:
-                break
-    
-            if (verbose == 0) & (block_number == 0):
-                print name
-    
-    
+            for block in blocks:
+                if (verbose == 0) & (block.number == 0):
+                    print block.name
+    except IOError, e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
     
-    # Close the input file
-    in_f.close()
+    if measure is not None:
+        if data is not None:
+            measure.count('input bytes', len(data))
+            measure.count('chunks', len(index))
+        measure.counts(summary)
+        measure.finish()
     
     # Exit
     sys.exit()
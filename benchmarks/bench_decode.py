@@ -0,0 +1,98 @@
+#! /usr/bin/python
+
+"""
+bench_decode.py - Measure the speed of decoding T2 data.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import t2file
+
+
+def decode_per_byte(s):
+
+    # The original decoding loop, kept here for comparison.
+    new = ""
+
+    for i in s:
+        new = new + chr(ord(i)^90)
+
+    return new
+
+
+def decode_into(buf, pos, s):
+
+    # Decode the string into the preallocated buffer at the given position
+    # and return the position following the decoded data.
+    end = pos + len(s)
+    buf[pos:end] = t2file.decode(s)
+    return end
+
+
+def decode_blocks(s):
+
+    # Decode the data into a preallocated buffer in 256 byte blocks, as the
+    # T2 tools do.
+    buf = bytearray(len(s))
+    pos = 0
+    while pos < len(s):
+        pos = decode_into(buf, pos, s[pos:pos+256])
+
+    return buf
+
+
+def measure(function, data, repeat):
+
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        function(data)
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+
+    return best
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    else:
+        size = 1 << 20
+
+    data = os.urandom(size)
+
+    # Check that the methods agree before timing them.
+    sample = data[:4096]
+    if decode_per_byte(sample) != t2file.decode(sample) or \
+       decode_per_byte(sample) != str(decode_blocks(sample)):
+        sys.stderr.write("Decoding methods do not agree.\n")
+        sys.exit(1)
+
+    for label, function, repeat in (
+        ("per byte", decode_per_byte, 1),
+        ("table", t2file.decode, 5),
+        ("table (blocks)", decode_blocks, 5)):
+
+        t = measure(function, data, repeat)
+        print "%-16s %10.2f MB/s" % (label, size / (t * 1048576.0))
+
+    sys.exit()
@@ -0,0 +1,84 @@
+#! /usr/bin/python
+
+"""
+bench_gzip.py - Measure the speed of writing compressed UEF files.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gzip, multiprocessing, os, sys, tempfile, time
+
+import corpus, gzipwriter
+
+
+def write_gzip(path, data, level):
+
+    f = gzip.open(path, "wb", level)
+    for i in range(0, len(data), 256):
+        f.write(data[i:i+256])
+    f.close()
+
+
+def write_parallel(path, data, level, threads):
+
+    f = gzipwriter.GzipWriter(open(path, "wb"), level, threads)
+    for i in range(0, len(data), 256):
+        f.write(data[i:i+256])
+    f.close()
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    else:
+        size = 16 << 20
+
+    data = corpus.file_data(size, size)
+    threads = multiprocessing.cpu_count()
+
+    fd, path = tempfile.mkstemp(suffix = ".uef.gz")
+    os.close(fd)
+
+    print "%d bytes, %d threads available" % (size, threads)
+    print "%-20s %5s %10s %8s" % ("writer", "level", "MB/s", "ratio")
+
+    try:
+        for level in (1, 3, 6, 9):
+
+            writers = [("gzip module", write_gzip, (level,)),
+                       ("GzipWriter (1)", write_parallel, (level, 1))]
+            if threads > 1:
+                writers.append(("GzipWriter (%i)" % threads, write_parallel,
+                                (level, threads)))
+
+            for label, function, args in writers:
+
+                t = time.time()
+                function(path, data, *args)
+                t = time.time() - t
+
+                if gzip.open(path, "rb").read() != data:
+                    sys.stderr.write("Compressed data differs for %s.\n" % label)
+                    sys.exit(1)
+
+                print "%-20s %5i %10.2f %8.3f" % (
+                    label, level, size / (t * 1048576.0),
+                    os.path.getsize(path) / float(size))
+    finally:
+        os.remove(path)
+
+    sys.exit()
@@ -0,0 +1,118 @@
+#! /usr/bin/python
+
+"""
+bench_memory.py - Measure the peak memory used by the tools as the size of
+                  their input grows, with and without the --stream option,
+                  reporting the results as JSON and failing if the memory
+                  used when streaming grows with the input.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, shutil, sys, tempfile
+
+import corpus
+
+tools_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# The memory limit given to the tools when streaming.
+LIMIT = "1M"
+
+# The size of each file in the inputs.
+FILE_SIZE = 50000
+
+# The amount, in kilobytes, by which the peak memory used by a tool when
+# streaming may vary across the sizes of input.
+ALLOWANCE = 2048
+
+# The tools measured, the kind of input each one reads and its arguments,
+# with "IN" standing for the input path. The output is discarded so that
+# only the memory used by the tools is measured.
+cases = [
+    ("T2UEF", "t2", ["T2UEF.py", "IN", os.devnull]),
+    ("T2INF", "t2", ["T2INF.py", "--format", "tar", "IN", "-"]),
+    ("UEF2INF", "uef", ["UEF2INF.py", "--format", "tar", "IN", "-"]),
+    ("UEF2INF", "uef.gz", ["UEF2INF.py", "--format", "tar", "IN", "-"]),
+    ("INF2UEF", "inf", ["INF2UEF.py", "-c", "IN", os.devnull]),
+    ]
+
+
+if __name__ == "__main__":
+
+    try:
+        sizes = map(int, sys.argv[1:]) or [4, 64, 1024]
+        for size in sizes:
+            if size < 1:
+                raise ValueError
+    except ValueError:
+        sys.stderr.write("Usage: bench_memory.py [input size in megabytes ...]\n\n")
+        sys.stderr.write("Measure the peak memory used by each tool for inputs of each size given\n")
+        sys.stderr.write("(default: 4, 64 and 1024), with and without --stream %s. Fails if the peak\n" % LIMIT)
+        sys.stderr.write("with --stream grows by more than %i KB across the sizes.\n" % ALLOWANCE)
+        sys.exit(1)
+
+    work_dir = tempfile.mkdtemp()
+    results = []
+
+    try:
+        for size in sizes:
+
+            count = max(1, (size << 20) // FILE_SIZE)
+
+            # Create each kind of input needed for this size
+            inputs = {}
+            for name, kind, command in cases:
+                if not inputs.has_key(kind):
+                    inputs[kind] = os.path.join(work_dir, corpus.kinds[kind])
+                    corpus.make(kind, inputs[kind], count, FILE_SIZE)
+
+            for name, kind, command in cases:
+                for options in ([], ["--stream", LIMIT]):
+
+                    args = [sys.executable, os.path.join(tools_dir, command[0])]
+                    args = args + options
+                    for arg in command[1:]:
+                        if arg == "IN":
+                            arg = inputs[kind]
+                        args.append(arg)
+
+                    seconds, rss = corpus.run(args)
+                    results.append({"name": name, "input": kind,
+                                    "megabytes": size, "stream": options != [],
+                                    "seconds": seconds, "peak kilobytes": rss})
+
+            for path in inputs.values():
+                corpus.remove(path)
+    finally:
+        shutil.rmtree(work_dir)
+
+    corpus.report({"limit": LIMIT, "allowance": ALLOWANCE}, results)
+
+    # Compare the peaks of each tool when streaming inputs of different sizes
+    peaks = {}
+    for result in results:
+        if result["stream"]:
+            key = (result["name"], result["input"])
+            peaks.setdefault(key, []).append(result["peak kilobytes"])
+
+    failed = 0
+    for (name, kind), values in sorted(peaks.items()):
+        growth = max(values) - min(values)
+        if growth > ALLOWANCE:
+            sys.stderr.write("%s with --stream %s peaks differing by %i KB across the sizes of %s input.\n" % (name, LIMIT, growth, kind))
+            failed = 1
+
+    sys.exit(failed)
@@ -0,0 +1,111 @@
+#! /usr/bin/python
+
+"""
+bench_startup.py - Measure the time taken to start each of the tools and
+                   convert a tiny input, reporting the results as JSON.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, shutil, sys, tempfile
+
+import corpus
+
+tools_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# The tools measured, the kind of input each one reads and its arguments,
+# with "IN" and "OUT" standing for the input and output paths. The inputs
+# are so small that the time taken is almost all spent starting up.
+cases = [
+    ("T2UEF", "t2", ["T2UEF.py", "IN", "OUT"]),
+    ("T2INF", "t2", ["T2INF.py", "IN", "OUT"]),
+    ("UEF2INF", "uef", ["UEF2INF.py", "IN", "OUT"]),
+    ("INF2UEF", "inf", ["INF2UEF.py", "IN", "OUT"]),
+    ]
+
+
+def run(args, output_path, runs):
+
+    # Run a command the given number of times and return the times taken,
+    # sorted from the fastest.
+
+    times = []
+
+    for i in range(runs):
+        corpus.remove(output_path)
+        times.append(corpus.run(args)[0])
+
+    times.sort()
+    return times
+
+
+def result(name, directory, times):
+
+    return {"name": name, "tools": directory, "best seconds": times[0],
+            "median seconds": times[len(times) // 2]}
+
+
+if __name__ == "__main__":
+
+    try:
+        runs = 20
+        if len(sys.argv) > 1:
+            runs = int(sys.argv[1])
+            if runs < 1:
+                raise ValueError
+    except ValueError:
+        sys.stderr.write("Usage: bench_startup.py [runs [tools directory ...]]\n\n")
+        sys.stderr.write("Measure the tools in this directory, or in each of the directories given,\n")
+        sys.stderr.write("such as a checkout of an earlier version, for comparison.\n")
+        sys.exit(1)
+
+    directories = map(os.path.abspath, sys.argv[2:]) or [os.path.abspath(tools_dir)]
+
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        # Create each kind of input needed, holding a single small file
+        inputs = {}
+        for name, kind, command in cases:
+            if not inputs.has_key(kind):
+                inputs[kind] = os.path.join(work_dir, corpus.kinds[kind])
+                corpus.make(kind, inputs[kind], 1, 64)
+
+        output_path = os.path.join(work_dir, "output")
+
+        # The time taken to start the interpreter alone
+        results = [result("python", None,
+                          run([sys.executable, "-c", "pass"], output_path, runs))]
+
+        for directory in directories:
+            for name, kind, command in cases:
+
+                args = [sys.executable]
+                for arg in command:
+                    if arg == "IN":
+                        arg = inputs[kind]
+                    elif arg == "OUT":
+                        arg = output_path
+                    elif arg.endswith(".py"):
+                        arg = os.path.join(directory, arg)
+                    args.append(arg)
+
+                results.append(result(name, directory, run(args, output_path, runs)))
+    finally:
+        shutil.rmtree(work_dir)
+
+    corpus.report({"runs": runs}, results)
+    sys.exit()
@@ -0,0 +1,123 @@
+#! /usr/bin/python
+
+"""
+bench_tools.py - Measure the time taken and memory used by each of the tools
+                 to convert a synthetic corpus, reporting the results as JSON.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, shutil, sys, tempfile
+
+import corpus
+
+tools_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# The conversions measured: a name, the kind of input, the tool and its
+# arguments, with "IN" and "OUT" standing for the input and output paths.
+cases = [
+    ("T2UEF", "t2", ["T2UEF.py", "IN", "OUT"]),
+    ("T2UEF -c", "t2", ["T2UEF.py", "-c", "IN", "OUT"]),
+    ("T2INF", "t2", ["T2INF.py", "IN", "OUT"]),
+    ("T2INF -l", "t2", ["T2INF.py", "-l", "IN"]),
+    ("UEF2INF", "uef", ["UEF2INF.py", "IN", "OUT"]),
+    ("UEF2INF gzip", "uef.gz", ["UEF2INF.py", "IN", "OUT"]),
+    ("UEF2INF 0x102", "uef102", ["UEF2INF.py", "IN", "OUT"]),
+    ("UEF2INF 0x104", "uef104", ["UEF2INF.py", "IN", "OUT"]),
+    ("UEF2INF 0x114", "uef114", ["UEF2INF.py", "IN", "OUT"]),
+    ("UEF2INF -l", "uef", ["UEF2INF.py", "-l", "IN"]),
+    ("UEF2INF -l gzip", "uef.gz", ["UEF2INF.py", "-l", "IN"]),
+    ("INF2UEF", "inf", ["INF2UEF.py", "IN", "OUT"]),
+    ]
+
+
+def path_size(path):
+
+    # Return the size of a file or the total size of the files in a
+    # directory.
+    if os.path.isdir(path):
+        return sum([os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)])
+
+    return os.path.getsize(path)
+
+
+def measure(name, kind, command, work_dir, inputs, data_bytes, repeat):
+
+    input_path = inputs[kind]
+    output_path = os.path.join(work_dir, "output")
+
+    args = [sys.executable]
+    for arg in command:
+        if arg == "IN":
+            arg = input_path
+        elif arg == "OUT":
+            arg = output_path
+        elif arg.endswith(".py"):
+            arg = os.path.join(tools_dir, arg)
+        args.append(arg)
+
+    best = None
+    peak = 0
+
+    for i in range(repeat):
+
+        corpus.remove(output_path)
+
+        t, rss = corpus.run(args)
+        if best is None or t < best:
+            best = t
+        peak = max(peak, rss)
+
+    return {"name": name, "input": kind, "input bytes": path_size(input_path),
+            "data bytes": data_bytes, "seconds": best,
+            "MB/s": data_bytes / (best * 1048576.0), "peak RSS kB": peak}
+
+
+if __name__ == "__main__":
+
+    try:
+        values = map(int, sys.argv[1:])
+        if len(values) > 3:
+            raise ValueError
+    except ValueError:
+        sys.stderr.write("Usage: bench_tools.py [files [file size [repeat]]]\n")
+        sys.exit(1)
+
+    files, size, repeat = (values + [200, 8192, 3][len(values):])[:3]
+
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        # Create each kind of input needed
+        inputs = {}
+        for name, kind, command in cases:
+            if not inputs.has_key(kind):
+                inputs[kind] = os.path.join(work_dir, corpus.kinds[kind])
+                corpus.make(kind, inputs[kind], files, size)
+
+        # The amount of file data stored in each input
+        data_bytes = sum([size + i for i in range(files)])
+
+        results = []
+        for name, kind, command in cases:
+            results.append(measure(name, kind, command, work_dir, inputs,
+                                   data_bytes, repeat))
+    finally:
+        shutil.rmtree(work_dir)
+
+    corpus.report({"files": files, "file size": size, "repeat": repeat},
+                  results)
+    sys.exit()
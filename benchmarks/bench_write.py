@@ -0,0 +1,144 @@
+#! /usr/bin/python
+
+"""
+bench_write.py - Compare the speed of writing the chunks for a tape to a UEF
+                 file one write at a time and through the buffered UEFWriter.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import ueffile
+
+
+def number_per_byte(size, n):
+
+    # The original number function, kept here for comparison.
+    s = ""
+
+    while size > 0:
+        i = n % 256
+        s = s + chr(i)
+        n = n >> 8
+        size = size - 1
+
+    return s
+
+
+def chunk_per_write(f, n, data):
+
+    # The original chunk function, kept here for comparison.
+    f.write(number_per_byte(2, n))
+    f.write(number_per_byte(4, len(data)))
+    f.write(data)
+
+
+def write_header_per_chunk(f, creator):
+
+    # The original write_header function, kept here for comparison.
+    f.write(ueffile.MAGIC)
+    f.write(number_per_byte(1, 6) + number_per_byte(1, 0))
+
+    we_are = creator + "\000"
+    if (len(we_are) % 4) != 0:
+        we_are = we_are + ("\000"*(4-(len(we_are) % 4)))
+
+    chunk_per_write(f, 0, we_are)
+    chunk_per_write(f, 5, number_per_byte(1, 1))
+
+
+def write_per_chunk(f, blocks):
+
+    write_header_per_chunk(f, "bench_write.py")
+    chunk_per_write(f, 0x110, number_per_byte(2, 0x05dc))
+    chunk_per_write(f, 0x100, number_per_byte(1, 0xdc))
+
+    for i in range(len(blocks)):
+        if i % 16 == 0:
+            chunk_per_write(f, 0x110, number_per_byte(2, 0x05dc))
+        else:
+            chunk_per_write(f, 0x110, number_per_byte(2, 0x0258))
+        chunk_per_write(f, 0x100, blocks[i])
+
+    chunk_per_write(f, 0x110, number_per_byte(2, 0x0258))
+    chunk_per_write(f, 0x112, number_per_byte(2, 0x0258))
+
+
+def write_batched(f, blocks):
+
+    writer = ueffile.UEFWriter(f)
+    writer.write_header("bench_write.py")
+    writer.start_tape()
+
+    for i in range(len(blocks)):
+        writer.block((blocks[i],), i % 16 == 0)
+
+    writer.end_tape()
+    writer.flush()
+
+
+def measure(function, path, blocks, repeat):
+
+    best = None
+    for i in range(repeat):
+        f = open(path, "wb")
+        t = time.time()
+        function(f, blocks)
+        f.close()
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+
+    return best
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 100000
+
+    # Blocks of the usual size, including the header and CRCs
+    blocks = [os.urandom(256 + 30) for i in range(count)]
+    path = "bench_write.uef"
+
+    try:
+        # Check that the methods agree before timing them.
+        output = []
+        for function in write_per_chunk, write_batched:
+            measure(function, path, blocks[:64], 1)
+            output.append(open(path, "rb").read())
+
+        if output[0] != output[1]:
+            sys.stderr.write("Writing methods do not agree.\n")
+            sys.exit(1)
+
+        size = os.path.getsize(path) * count // 64
+
+        for label, function in (("per chunk", write_per_chunk),
+                                ("batched", write_batched)):
+
+            t = measure(function, path, blocks, 3)
+            print "%-16s %10.2f MB/s" % (label, size / (t * 1048576.0))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    sys.exit()
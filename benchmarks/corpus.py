@@ -0,0 +1,269 @@
+#! /usr/bin/python
+
+"""
+corpus.py - Create synthetic T2 files, UEF files and directories of files with
+            .inf files for measuring the speed of the tools.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import binascii, json, os, platform, random, shutil, struct, subprocess, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import cassette, gzipwriter, t2file, ueffile
+
+# The kinds of input that can be created and the names given to them.
+kinds = {"t2": "tape.t2", "uef": "tape.uef", "uef.gz": "tape.uef.gz",
+         "uef102": "tape102.uef", "uef104": "tape104.uef",
+         "uef114": "tape114.uef", "inf": "files"}
+
+
+def file_data(size, seed):
+
+    # Create data which compresses roughly as well as a typical file: a mix
+    # of repeated text and random bytes. The same seed always gives the same
+    # data, so each kind of input contains the same files.
+    random.seed(seed)
+    pieces = []
+    total = 0
+    while total < size:
+        if random.random() < 0.5:
+            piece = "10 PRINT \"HELLO\"\r20 GOTO 10\r" * random.randrange(1, 32)
+        else:
+            n = random.randrange(16, 512)
+            piece = binascii.unhexlify("%0*x" % (n * 2, random.getrandbits(n * 8)))
+        pieces.append(piece)
+        total = total + len(piece)
+
+    return "".join(pieces)[:size]
+
+
+def files(count, size):
+
+    # Generate the name, load address, execution address and contents of
+    # each file, with the sizes varied a little.
+    for i in range(count):
+        yield "FILE%i" % i, 0x1900, 0x8023, file_data(size + i, i)
+
+
+def blocks(count, size):
+
+    # Generate each complete block, from the synchronisation byte to the data
+    # CRC, with the file it belongs to.
+    for name, load, exec_addr, data in files(count, size):
+        for block in cassette.make_blocks(data, name, load, exec_addr):
+            yield name, "".join(map(str, block.parts))
+
+
+# The ten bits stored for each byte in an explicit tape data chunk: a start
+# bit of 0, the data bits with the least significant first, and a stop bit
+# of 1.
+FRAMES = [(i << 1) | 0x200 for i in range(256)]
+
+def explicit_bits(data):
+
+    # Return the data framed with start and stop bits, as stored in an
+    # explicit tape data chunk (0x102) in UEF 0.10 files, preceded by the
+    # number of unused bits at the end. Every four bytes become five.
+    out = []
+    whole = len(data) - (len(data) % 4)
+
+    for i in range(0, whole, 4):
+        value = FRAMES[ord(data[i])] | (FRAMES[ord(data[i+1])] << 10) | \
+                (FRAMES[ord(data[i+2])] << 20) | (FRAMES[ord(data[i+3])] << 30)
+        out.append(struct.pack("<Q", value)[:5])
+
+    # Pad the frames for the remaining bytes with stop bits.
+    remaining = len(data) - whole
+    value = 0
+    for j in range(remaining):
+        value = value | (FRAMES[ord(data[whole + j])] << (10 * j))
+
+    bits = remaining * 10
+    excess = (8 - (bits % 8)) % 8
+    value = value | (((1 << excess) - 1) << bits)
+    out.append(struct.pack("<Q", value)[:(bits + excess) // 8])
+
+    return chr(excess) + "".join(out)
+
+
+def defined_format(data):
+
+    # Return the data as stored in a defined format tape data chunk (0x104)
+    # with eight data bits, no parity and one stop bit.
+    return chr(8) + "N" + chr(1) + data
+
+
+# The cycles recorded for each byte in a security cycles chunk, as a string
+# of digits: a 0 bit is one low cycle (0) and a 1 bit is two high cycles (11).
+CYCLES = ["0" + "".join([("0", "11")[(i >> j) & 1] for j in range(8)]) + "11"
+          for i in range(256)]
+
+def security_cycles(data):
+
+    # Return the data as stored in a security cycles chunk (0x114), preceded
+    # by a short carrier tone, with each cycle stored in one bit, most
+    # significant first.
+    text = "1111" + "".join([CYCLES[ord(c)] for c in data])
+    count = len(text)
+    text = text + "0" * (-count % 8)
+    cycles = binascii.unhexlify("%0*x" % (len(text) // 4, long(text, 2)))
+    return struct.pack("<HB", count & 0xffff, count >> 16) + "WW" + cycles
+
+
+def make_t2(path, count, size):
+
+    f = open(path, "wb")
+    f.write("\000" * 5)
+    for name, block in blocks(count, size):
+        f.write(t2file.decode(block))
+    f.write(chr(t2file.END_MARKER ^ t2file.XOR_KEY))
+    f.close()
+
+
+def make_uef(path, count, size, compress = 0, chunk_id = 0x100):
+
+    if compress:
+        f = gzipwriter.open(path, 6)
+    else:
+        f = open(path, "wb")
+
+    # Files with explicit tape data use version 0.10 of the format, which
+    # records the number of unused bits in each chunk.
+    writer = ueffile.UEFWriter(f)
+    writer.write(ueffile.MAGIC + chr(10) + chr(0))
+    writer.chunk(0, "corpus.py\000\000\000")
+    writer.gap(ueffile.LONG_GAP)
+
+    encode = {0x102: explicit_bits, 0x104: defined_format,
+              0x114: security_cycles}
+
+    for name, block in blocks(count, size):
+        if chunk_id == 0x100:
+            writer.block((block,))
+        else:
+            writer.gap(ueffile.SHORT_GAP)
+            writer.chunk(chunk_id, encode[chunk_id](block))
+
+    writer.flush()
+    f.close()
+
+
+def make_inf(path, count, size):
+
+    os.mkdir(path)
+    previous = None
+
+    for name, load, exec_addr, data in files(count, size):
+
+        open(os.path.join(path, name), "wb").write(data)
+
+        if previous is not None:
+            inf.write("\tNEXT $.%s\n" % name)
+            inf.close()
+
+        inf = open(os.path.join(path, name + ".inf"), "w")
+        inf.write("$.%s\t%X\t%X\t%X" % (name, load, exec_addr, len(data)))
+        previous = name
+
+    if previous is not None:
+        inf.write("\n")
+        inf.close()
+
+
+def remove(path):
+
+    # Remove a file or a directory and its contents, if it exists.
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def run(args):
+
+    # Run a command, discarding its output, and return the time taken and
+    # the peak resident memory used in kilobytes. Waiting for the process
+    # with wait4 gives the resource usage of that process alone.
+    devnull = open(os.devnull, "w")
+    t = time.time()
+    process = subprocess.Popen(args, stdout = devnull)
+    pid, status, usage = os.wait4(process.pid, 0)
+    t = time.time() - t
+    devnull.close()
+
+    # Prevent the subprocess module from waiting for the process again.
+    process.returncode = status
+
+    if status != 0:
+        raise RuntimeError("Command failed: %s" % " ".join(args))
+
+    # Linux reports kilobytes but Mac OS X reports bytes.
+    peak = usage.ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak // 1024
+
+    return t, peak
+
+
+def report(settings, results):
+
+    # Write a report of the results, with the settings used and details of
+    # the system they were measured on, to stdout as JSON.
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    report.update(settings)
+
+    json.dump(report, sys.stdout, indent = 2, sort_keys = True,
+              separators = (",", ": "))
+    sys.stdout.write("\n")
+
+
+def make(kind, path, count, size):
+
+    # Create an input of the given kind containing count files of roughly
+    # the given size.
+    if kind == "t2":
+        make_t2(path, count, size)
+    elif kind == "uef":
+        make_uef(path, count, size)
+    elif kind == "uef.gz":
+        make_uef(path, count, size, compress = 1)
+    elif kind == "uef102":
+        make_uef(path, count, size, chunk_id = 0x102)
+    elif kind == "uef104":
+        make_uef(path, count, size, chunk_id = 0x104)
+    elif kind == "uef114":
+        make_uef(path, count, size, chunk_id = 0x114)
+    elif kind == "inf":
+        make_inf(path, count, size)
+    else:
+        raise ValueError("Unknown kind of input: %s" % kind)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 5 or not kinds.has_key(sys.argv[1]):
+        sys.stderr.write("Usage: corpus.py <kind> <path> <files> <file size>\n\n")
+        sys.stderr.write("Create a synthetic input of one of the following kinds:\n")
+        sys.stderr.write("%s\n" % ", ".join(sorted(kinds.keys())))
+        sys.exit(1)
+
+    make(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    sys.exit()
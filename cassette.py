@@ -0,0 +1,232 @@
+"""
+cassette.py - Routines for handling Acorn cassette filing system blocks.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import binascii, struct, sys
+
+# Fields following the name in each block header: load address, execution
+# address, block number, block length, block flag and next address.
+HEADER = struct.Struct("<IIHHBI")
+
+# CRCs are stored with the high byte first.
+CRC = struct.Struct(">H")
+
+# The header fields followed by the bytes of the header CRC, so that a block
+# header can be read with a single call.
+HEADER_AND_CRC = struct.Struct("<IIHHBIBB")
+
+# Offset of the block length within the header fields.
+LENGTH_OFFSET = 10
+
+# The largest amount of data stored in each block.
+BLOCK_SIZE = 256
+
+# Block flag bit marking the last block of a file.
+LAST_BLOCK = 0x80
+
+# The amount of the start of a block searched for the end of the name before
+# searching the whole block. Names on tape have at most ten characters.
+NAME_SEARCH = 32
+
+
+class Block(object):
+
+    # A block read from a tape. The block attribute holds the complete decoded
+    # block, from the synchronisation byte to the block CRC, as a string or a
+    # buffer referring to the file it was read from, or None if only the
+    # header was read; offset is the position of the data within it and
+    # position is the position of the block within the file it was read from.
+    # If the CRCs were checked when the block was read then checked holds the
+    # pair of flags returned by check_block. Blocks made by make_blocks hold
+    # their header, data and data CRC as separate parts instead, so that the
+    # data does not need to be copied.
+
+    __slots__ = ("name", "load", "exec_addr", "number", "length", "flag",
+                 "next_addr", "header_crc", "block", "offset", "position",
+                 "checked", "parts")
+
+    def __init__(self, name, load, exec_addr, number, length, flag,
+                 next_addr, header_crc, block = None, offset = 0,
+                 position = None, checked = None, parts = None):
+
+        self.name = name
+        self.load = load
+        self.exec_addr = exec_addr
+        self.number = number
+        self.length = length
+        self.flag = flag
+        self.next_addr = next_addr
+        self.header_crc = header_crc
+        self.block = block
+        self.offset = offset
+        self.position = position
+        self.checked = checked
+        self.parts = parts
+
+    def payload(self):
+
+        # Return a view of the data in the block without copying it.
+        if self.parts is not None:
+            return self.parts[1]
+
+        if self.block is None or self.length == 0:
+            return buffer("")
+
+        return buffer(self.block, self.offset, self.length)
+
+
+def crc(s, value = 0):
+
+    # The cassette filing system uses the CRC-16 with polynomial 0x1021 and
+    # no final exclusive-OR (CRC-16/XMODEM), so the table-driven version in
+    # the binascii module can be used. Pass the previous value to continue a
+    # calculation over several strings.
+    return binascii.crc_hqx(s, value)
+
+
+def find_name_end(block):
+
+    # Return the position of the byte terminating the name in a block, which
+    # may be a string or a buffer, or -1 if there is none. Only the start of
+    # the block is copied to search it unless the name is unusually long.
+
+    name_end = block[:NAME_SEARCH].find("\000", 1)
+    if name_end == -1 and len(block) > NAME_SEARCH:
+        name_end = str(block).find("\000", 1)
+
+    return name_end
+
+
+def parse_block(block):
+
+    # Read the header of a complete decoded block, which may be a string or a
+    # buffer, and return a Block object referring to it without copying it,
+    # or None if the block is too short to contain a header.
+
+    name_end = block[:NAME_SEARCH].find("\000", 1)
+    if name_end == -1:
+        name_end = find_name_end(block)
+        if name_end == -1:
+            return None
+
+    data_start = name_end + 1 + HEADER_AND_CRC.size
+    if len(block) < data_start:
+        return None
+
+    load, exec_addr, number, length, flag, next_addr, crc_high, crc_low = \
+        HEADER_AND_CRC.unpack_from(block, name_end + 1)
+
+    return Block(block[1:name_end], load, exec_addr, number, length, flag,
+                 next_addr, (crc_high << 8) | crc_low, block, data_start)
+
+
+def make_blocks(data, name, load, exec_addr, block_size = BLOCK_SIZE,
+                first = 0, final = 1):
+
+    # Generate the Block objects needed to store the data as a file on tape.
+    # The parts of each block are the header, from the synchronisation byte
+    # to the header CRC, a view of its data and the data CRC, so the data is
+    # not copied. An empty file is stored as a single empty block. A file may be
+    # stored in parts, each a multiple of the block size except the last,
+    # by giving the number of the first block in each part and setting final
+    # for the last part.
+
+    prefix = "*" + name[:10] + "\000"
+    length = len(data)
+    pos = 0
+    number = first
+
+    while final or pos < length:
+
+        payload = buffer(data, pos, block_size)
+        pos = pos + len(payload)
+
+        if final and pos >= length:
+            flag = LAST_BLOCK
+        else:
+            flag = 0
+
+        header = prefix + HEADER.pack(load, exec_addr, number & 0xffff,
+                                      len(payload), flag, 0)
+        header_crc = crc(buffer(header, 1))
+        header = header + CRC.pack(header_crc)
+
+        yield Block(name[:10], load, exec_addr, number & 0xffff, len(payload),
+                    flag, 0, header_crc, offset = len(header),
+                    parts = (header, payload, CRC.pack(crc(payload))))
+
+        if flag & LAST_BLOCK:
+            break
+
+        number = number + 1
+
+
+def check_block(block):
+
+    # Check the CRCs in a complete block, from the synchronisation byte to
+    # the block CRC, and return a pair of flags indicating whether the
+    # header and data are intact.
+
+    name_end = find_name_end(block)
+    if name_end == -1:
+        return 0, 0
+
+    header_end = name_end + 1 + HEADER.size
+    if len(block) < header_end + CRC.size:
+        return 0, 0
+
+    header_ok = crc(buffer(block, 1, header_end - 1)) == \
+                CRC.unpack_from(block, header_end)[0]
+
+    block_length = struct.unpack_from("<H", block,
+                                      name_end + 1 + LENGTH_OFFSET)[0]
+    if block_length == 0:
+        return header_ok, 1
+
+    data_start = header_end + CRC.size
+    data_end = data_start + block_length
+
+    if len(block) < data_end + CRC.size:
+        return header_ok, 0
+
+    data_ok = crc(buffer(block, data_start, block_length)) == \
+              CRC.unpack_from(block, data_end)[0]
+
+    return header_ok, data_ok
+
+
+def verify_block(block, name, block_number, stream = sys.stderr):
+
+    # Check the block and report any errors found, returning true if the
+    # block is intact.
+
+    header_ok, data_ok = check_block(block)
+    return report_block(header_ok, data_ok, name, block_number, stream)
+
+
+def report_block(header_ok, data_ok, name, block_number, stream = sys.stderr):
+
+    # Report the errors found when a block was checked, returning true if the
+    # block is intact.
+
+    if not header_ok:
+        stream.write("Bad header CRC in block %X of %s\n" % (block_number, name))
+    if not data_ok:
+        stream.write("Bad data CRC in block %X of %s\n" % (block_number, name))
+
+    return header_ok and data_ok
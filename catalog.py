@@ -0,0 +1,175 @@
+"""
+catalog.py - Sidecar catalogs describing the files on a tape, so that they can
+             be listed without reading the tape again.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, string, sys
+
+# Determine the platform on which the program is running
+if sys.platform == "RISCOS":
+    suffix = "/"
+else:
+    suffix = "."
+
+# The first field of the first line of every catalog, followed by the size
+# and modification time of the tape file it describes.
+MAGIC = "T2Tools catalog 1"
+
+
+class Entry(object):
+
+    # A file on a tape: its name, load and execution addresses, length, the
+    # number of its first block, the number of blocks it occupies and the
+    # position of its first block within the tape file.
+
+    __slots__ = ("name", "load", "exec_addr", "length", "first", "blocks",
+                 "position")
+
+    def __init__(self, name, load, exec_addr, length = 0, first = 0,
+                 blocks = 0, position = 0):
+
+        self.name = name
+        self.load = load
+        self.exec_addr = exec_addr
+        self.length = length
+        self.first = first
+        self.blocks = blocks
+        self.position = position
+
+
+def catalog_path(path):
+
+    return path + suffix + "cat"
+
+
+def build(blocks):
+
+    # Return a list of entries for the files made up by the blocks, which
+    # only need to contain their headers. A file starts with each block
+    # numbered zero, as when the files are extracted.
+
+    entries = []
+    entry = None
+
+    for block in blocks:
+
+        if block.number == 0 or entry is None:
+            entry = Entry(block.name, block.load, block.exec_addr,
+                          first = block.number, position = block.position)
+            entries.append(entry)
+
+        entry.length = entry.length + block.length
+        entry.blocks = entry.blocks + 1
+
+    return entries
+
+
+def read(path):
+
+    # Return the entries in the catalog for the tape file, or None if there
+    # is no catalog or it does not match the size and modification time of
+    # the tape file.
+
+    try:
+        info = os.stat(path)
+        lines = open(catalog_path(path), "r").read().split("\n")
+    except (IOError, OSError):
+        return None
+
+    try:
+        magic, size, mtime = lines[0].split("\t")
+        if magic != MAGIC or long(size) != info.st_size or \
+           float(mtime) != info.st_mtime:
+            return None
+
+        entries = []
+        for line in lines[1:]:
+
+            if line == "":
+                continue
+
+            # The name is the last field, so it may contain any characters
+            # other than a newline.
+            fields = line.split("\t", 6)
+            values = map(lambda field: string.atol(field, 16), fields[:6])
+            load, exec_addr, length, first, blocks, position = values
+            entries.append(Entry(fields[6], load, exec_addr, length, first,
+                                 blocks, position))
+
+    except (ValueError, IndexError):
+        # The catalog is damaged, so ignore it
+        return None
+
+    return entries
+
+
+def write(path, entries, info):
+
+    # Write the entries to the catalog for the tape file, given the result of
+    # os.stat for the tape file before it was read. The catalog is written
+    # to a temporary file first so that readers never see a partial catalog.
+
+    lines = ["%s\t%i\t%r" % (MAGIC, info.st_size, info.st_mtime)]
+
+    for entry in entries:
+
+        if "\n" in entry.name or "\r" in entry.name:
+            raise ValueError("File name cannot be stored in a catalog: %r" % entry.name)
+
+        lines.append("%X\t%X\t%X\t%X\t%X\t%X\t%s" % (
+            entry.load, entry.exec_addr, entry.length, entry.first,
+            entry.blocks, entry.position, entry.name))
+
+    cat_file = catalog_path(path)
+    temp_file = cat_file + suffix + "tmp"
+
+    f = open(temp_file, "w")
+    try:
+        f.write(string.join(lines, "\n") + "\n")
+    finally:
+        f.close()
+
+    try:
+        os.rename(temp_file, cat_file)
+    except OSError:
+        # Platforms which cannot replace files by renaming them
+        os.remove(cat_file)
+        os.rename(temp_file, cat_file)
+
+
+def entries(path, read_blocks):
+
+    # Return the entries for the tape file from its catalog if it is up to
+    # date, otherwise call read_blocks to obtain the blocks in the tape file,
+    # build the entries and write a new catalog. The entries are returned
+    # even if the catalog cannot be written.
+
+    found = read(path)
+    if found is not None:
+        return found
+
+    blocks = read_blocks()
+    info = os.stat(path)
+    found = build(blocks)
+
+    try:
+        write(path, found, info)
+    except (IOError, OSError, ValueError):
+        pass
+
+    return found
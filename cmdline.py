@@ -0,0 +1,164 @@
+"""
+cmdline.py - A lightweight parser for the command line syntax used by the
+             tools, so that the cmdsyntax module only needs to be loaded when
+             the arguments cannot be parsed.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+
+# Brackets, option names and placeholders, which may contain spaces.
+TOKEN = re.compile(r"[][()|]|<[^>]*>|[^][()|<\s]+")
+
+
+def alternatives(syntax):
+
+    # Return the alternatives described by a syntax string of the form used
+    # by cmdsyntax, each as a dictionary mapping the options accepted to the
+    # names of their values (or None), a list of the options which must be
+    # given and a list of the names of the positional arguments. Only
+    # optional options, which may take a value, required options and
+    # positional arguments are understood; None is returned for anything
+    # more complicated.
+
+    tokens = TOKEN.findall(syntax)
+
+    # Remove the parentheses around each alternative
+    parts = [[]]
+    for token in tokens:
+        if token == "|":
+            parts.append([])
+        else:
+            parts[-1].append(token)
+
+    result = []
+
+    for part in parts:
+
+        if part[:1] == ["("] and part[-1:] == [")"]:
+            part = part[1:-1]
+
+        options = {}
+        required = []
+        positionals = []
+        optional = 0
+        option = None
+
+        for token in part:
+
+            if token == "[":
+                if optional:
+                    return None
+                optional = 1
+
+            elif token == "]":
+                if not optional:
+                    return None
+                optional = 0
+                option = None
+
+            elif token[:1] == "<":
+                if option is not None:
+                    options[option] = token[1:-1]
+                    option = None
+                elif optional:
+                    return None
+                else:
+                    positionals.append(token[1:-1])
+
+            elif token[:1] == "-":
+                if options.has_key(token):
+                    return None
+                options[token] = None
+                if optional:
+                    option = token
+                else:
+                    required.append(token)
+
+            else:
+                return None
+
+        if optional:
+            return None
+
+        result.append((options, required, positionals))
+
+    return result
+
+
+def match_alternative(options, required, positionals, args):
+
+    # Return a dictionary of the options and values given in the arguments,
+    # in the form returned by cmdsyntax, or None if they do not match.
+
+    match = {}
+    values = []
+
+    i = 0
+    while i < len(args):
+
+        arg = args[i]
+
+        if options.has_key(arg):
+
+            name = arg.lstrip("-")
+            if match.has_key(name):
+                return None
+            match[name] = 1
+
+            if options[arg] is not None:
+                i = i + 1
+                if i == len(args):
+                    return None
+                match[options[arg]] = args[i]
+
+        elif arg[:1] == "-" and arg != "-":
+            return None
+        else:
+            values.append(arg)
+
+        i = i + 1
+
+    if len(values) != len(positionals):
+        return None
+
+    for option in required:
+        if not match.has_key(option.lstrip("-")):
+            return None
+
+    for name, value in zip(positionals, values):
+        match[name] = value
+
+    return match
+
+
+def match(syntax, args):
+
+    # Return the match for the first alternative in the syntax which accepts
+    # the arguments, or None if none of them do, or if the syntax cannot be
+    # understood, in which case cmdsyntax should be used instead.
+
+    found = alternatives(syntax)
+    if found is None:
+        return None
+
+    for options, required, positionals in found:
+        result = match_alternative(options, required, positionals, args)
+        if result is not None:
+            return result
+
+    return None
@@ -0,0 +1,807 @@
+"""
+convert.py - Conversions between T2 files, UEF files and directories of files
+             with .inf files.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import fnmatch, os, string, sys
+import cassette, gzipwriter, sinks, streams, t2file, ueffile
+
+# Determine the platform on which the program is running
+if sys.platform == "RISCOS":
+    suffix = "/"
+else:
+    suffix = "."
+
+
+def new_summary():
+
+    return {"blocks": 0, "bad blocks": 0, "files": 0, "bytes": 0}
+
+
+def monitor(blocks, summary, verbose = 0, verify = 0, stats = None):
+
+    # Pass the blocks through, counting them, printing their names and numbers
+    # if verbose output is requested and checking their CRCs if required.
+
+    verify_block = cassette.verify_block
+    report_block = cassette.report_block
+    if stats is not None:
+        verify_block = stats.call("crc", verify_block)
+        report_block = stats.call("crc", report_block)
+
+    for block in blocks:
+
+        summary["blocks"] = summary["blocks"] + 1
+
+        if verbose == 1:
+            if block.number == 0:
+                print
+                print block.name,
+            print string.upper(hex(block.number)[2:]),
+
+        if verify == 1:
+            # Blocks may have been checked when they were decoded
+            if block.checked is not None:
+                header_ok, data_ok = block.checked
+                ok = report_block(header_ok, data_ok, block.name, block.number)
+            else:
+                ok = verify_block(block.block, block.name, block.number)
+
+            if not ok:
+                summary["bad blocks"] = summary["bad blocks"] + 1
+
+        yield block
+
+
+def read_t2(t2_file):
+
+    # Return the contents of a T2 file, given as a path or an open file
+    # object, mapped into memory if possible. File objects are left open.
+
+    if not isinstance(t2_file, basestring):
+        return t2file.map_file(t2_file)
+
+    try:
+        t2 = open(t2_file, "rb")
+    except IOError:
+        raise IOError("The input file could not be found: %s" % t2_file)
+
+    try:
+        return t2file.map_file(t2)
+    finally:
+        t2.close()
+
+
+def read_uef(uef_file):
+
+    # Return the contents of a UEF file, given as a path or an open file
+    # object, which may be gzipped, and the version numbers of the file
+    # format.
+
+    if isinstance(uef_file, basestring):
+        name = uef_file
+    else:
+        name = getattr(uef_file, "name", "<file>")
+
+    try:
+        return ueffile.map_file(uef_file)
+    except IOError:
+        raise IOError("The input file could not be found: %s" % name)
+    except ValueError:
+        raise ValueError("The input file is not a UEF file: %s" % name)
+
+
+def open_input(path):
+
+    # Return an open file object for an input file given as a path or as an
+    # open file object, and whether it should be closed after use.
+
+    if not isinstance(path, basestring):
+        return path, 0
+
+    try:
+        return open(path, "rb"), 1
+    except IOError:
+        raise IOError("The input file could not be found: %s" % path)
+
+
+def close_after(blocks, f):
+
+    # Pass the blocks through, closing the file they are read from when they
+    # have all been read or are no longer wanted.
+
+    try:
+        for block in blocks:
+            yield block
+    finally:
+        if f is not None:
+            f.close()
+
+
+def t2_stream(t2_file, limit = None):
+
+    # Return the blocks in a T2 file, given as a path or an open file object,
+    # read as a stream through a buffer whose size is set by the memory
+    # limit. The file is opened immediately so that any error is raised here.
+
+    f, close = open_input(t2_file)
+    window = streams.Window(f, streams.read_size(limit))
+    return close_after(t2file.stream_blocks(window), close and f or None)
+
+
+def uef_stream(uef_file, limit = None):
+
+    # Return the blocks in a UEF file, which may be gzipped, given as a path
+    # or an open file object, read as a stream through a buffer whose size is
+    # set by the memory limit. The file is opened and its header checked
+    # immediately so that any error is raised here.
+
+    size = streams.read_size(limit)
+    f, close = open_input(uef_file)
+
+    try:
+        window, minor, major = ueffile.open_stream(f, size)
+    except ValueError:
+        if close:
+            f.close()
+        raise ValueError("The input file is not a UEF file: %s" %
+                         getattr(f, "name", "<file>"))
+
+    blocks = ueffile.stream_blocks(window, minor, major)
+    return close_after(blocks, close and f or None)
+
+
+def t2_blocks(t2_file, headers_only = 0):
+
+    return t2file.read_blocks(read_t2(t2_file), headers_only = headers_only)
+
+
+def uef_blocks(uef_file, headers_only = 0):
+
+    data, minor, major = read_uef(uef_file)
+    return ueffile.read_blocks(data, minor, major, headers_only = headers_only)
+
+
+def matches(name, patterns):
+
+    # Return whether a file name matches any of the names or glob patterns
+    # given, ignoring case as the Acorn filing systems do.
+
+    name = string.lower(name)
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(name, string.lower(pattern)):
+            return 1
+
+    return 0
+
+
+def select_blocks(blocks, patterns):
+
+    # Pass through only the blocks of the files whose names match the
+    # patterns. Each file starts with a block numbered zero, or with the
+    # first block if the tape starts part of the way through a file.
+
+    selected = 0
+    first = 1
+
+    for block in blocks:
+
+        if block.number == 0 or first:
+            selected = matches(block.name, patterns)
+            first = 0
+
+        if selected:
+            yield block
+
+
+def t2_selected(data, patterns):
+
+    # Generate the blocks of the files in a mapped T2 file which match the
+    # patterns, finding them by reading only the block headers and decoding
+    # just the blocks selected.
+
+    for block in select_blocks(t2file.read_blocks(data, headers_only = 1),
+                               patterns):
+        yield t2file.read_data(data, block)
+
+
+def uef_selected(data, minor, major, patterns, index = None):
+
+    # Return the blocks of the files in a UEF file which match the patterns,
+    # finding them by reading only the block headers and then reading just
+    # the chunks containing the blocks selected.
+
+    if index is None:
+        index = ueffile.index_chunks(data)
+
+    # Any problem found when the file was decompressed is reported after the
+    # blocks selected have been read
+    positions = {}
+    try:
+        for block in select_blocks(ueffile.read_blocks(data, minor, major, index, 1),
+                                   patterns):
+            positions[block.position] = 1
+    except IOError:
+        pass
+
+    index = [entry for entry in index if positions.has_key(entry[1])]
+    return ueffile.read_blocks(data, minor, major, index)
+
+
+def write_files(blocks, out_path, stem = "noname", summary = None,
+                stats = None):
+
+    # Write the files contained in the blocks to the output directory, or to
+    # a sink from the sinks module, with a .inf file for each describing its
+    # load and execution addresses, its length and the file following it.
+
+    if summary is None:
+        summary = new_summary()
+
+    if isinstance(out_path, basestring):
+        sink = sinks.DirectorySink(out_path)
+    else:
+        sink = out_path
+
+    create = sink.create
+    write_inf = sink.write_inf
+    if stats is not None:
+        create = stats.call("create", create)
+        write_inf = stats.call("create", write_inf)
+
+    out = None             # Currently open file
+    inf = ""               # The start of its information file
+    write_file = ""        # Write the file using this name
+    file_length = 0        # File length
+
+    # Files already created
+    created = {}
+
+    # Unnamed file counter
+    n = 1
+
+    try:
+        for block in blocks:
+
+            # New file (block number is zero) or no previous file
+            if block.number == 0 or out is None:
+
+                # Set the new name of the file
+                previous_file = write_file
+                write_file = block.name
+
+                if created.has_key(write_file):
+                    write_file = write_file+"-"+str(n)
+                    n = n + 1
+
+                if write_file == "":
+                    write_file = stem+str(n)
+                    n = n + 1
+
+                try:
+                    new_out = create(write_file)
+                except IOError:
+                    # Couldn't open the file
+                    write_file = stem+str(n)
+                    n = n + 1
+                    new_out = create(write_file)
+
+                # New file, so close the last one (if there was one)
+                if out is not None:
+                    out.close()
+
+                    # Write the file length information and the NEXT
+                    # parameter to the previous .inf file
+                    write_inf(previous_file, inf + "%X\tNEXT $.%s\n" % (
+                        file_length, write_file))
+
+                out = new_out
+
+                # Reset the file length
+                file_length = 0
+
+                # Add file to the list of created files
+                created[write_file] = 1
+                summary["files"] = summary["files"] + 1
+
+                # Record the load and execution information for the .inf file
+                inf = "$.%s\t%X\t%X\t" % (write_file, block.load, block.exec_addr)
+
+            payload = block.payload()
+
+            if len(payload) > 0:
+
+                # Write the block to the relevant file
+                out.write(payload)
+
+                file_length = file_length + len(payload)
+                summary["bytes"] = summary["bytes"] + len(payload)
+
+        if out is not None:
+
+            out.close()
+            out = None
+
+            # Write the file length information to the last .inf file
+            write_inf(write_file, inf + "%X\n" % file_length)
+
+    finally:
+        if out is not None:
+            out.close()
+        if sink is not out_path:
+            sink.close()
+
+    return summary
+
+
+def t2_to_inf(t2_file, out_path, stem = "noname", verbose = 0, verify = 0,
+             format = "dir", store = None, select = None, limit = None):
+
+    # Extract the files in a T2 file to a directory or an archive, using the
+    # content-addressed store if one is given. The output may also be an
+    # open file object, for archives, or a sink, which are left open. If a
+    # list of names or glob patterns is given then only the files matching
+    # them are extracted. If a memory limit is given then the file is read
+    # as a stream, using no more than the limit for buffers.
+
+    summary = new_summary()
+    if limit is not None:
+        blocks = t2_stream(t2_file, limit)
+        if select is not None:
+            blocks = select_blocks(blocks, select)
+    elif select is None:
+        blocks = t2_blocks(t2_file)
+    else:
+        blocks = t2_selected(read_t2(t2_file), select)
+    blocks = monitor(blocks, summary, verbose, verify)
+
+    if hasattr(out_path, "write_inf"):
+        return write_files(blocks, out_path, stem, summary)
+
+    sink = sinks.open_sink(out_path, format, store)
+    try:
+        return write_files(blocks, sink, stem, summary)
+    finally:
+        sink.close()
+
+
+def uef_to_inf(uef_file, out_path, stem = "noname", verbose = 0, verify = 0,
+              format = "dir", store = None, select = None, limit = None):
+
+    # Extract the files in a UEF file to a directory or an archive, using the
+    # content-addressed store if one is given. The output may also be an
+    # open file object, for archives, or a sink, which are left open. If a
+    # list of names or glob patterns is given then only the files matching
+    # them are extracted. If a memory limit is given then the file is read
+    # as a stream, using no more than the limit for buffers.
+
+    summary = new_summary()
+    if limit is not None:
+        blocks = uef_stream(uef_file, limit)
+        if select is not None:
+            blocks = select_blocks(blocks, select)
+    elif select is None:
+        blocks = uef_blocks(uef_file)
+    else:
+        data, minor, major = read_uef(uef_file)
+        blocks = uef_selected(data, minor, major, select)
+    blocks = monitor(blocks, summary, verbose, verify)
+
+    if hasattr(out_path, "write_inf"):
+        return write_files(blocks, out_path, stem, summary)
+
+    sink = sinks.open_sink(out_path, format, store)
+    try:
+        return write_files(blocks, sink, stem, summary)
+    finally:
+        sink.close()
+
+
+def write_uef(blocks, uef_file, compress = 0, level = gzipwriter.DEFAULT_LEVEL,
+              creator = "T2Tools", summary = None, stats = None, limit = None,
+              threads = None):
+
+    # Write the blocks to a UEF file, optionally compressed with gzip on the
+    # given number of threads, or one for each processor if it is None. The
+    # file may be given as a path or as an open file object, which is left
+    # open. If a memory limit is given then the data is compressed in pieces
+    # whose size is set by the limit, one at a time.
+
+    if summary is None:
+        summary = new_summary()
+
+    if limit is None:
+        slice_size = gzipwriter.SLICE_SIZE
+    else:
+        threads = 1
+        slice_size = streams.write_size(limit)
+
+    # Create the UEF file
+    if not isinstance(uef_file, basestring):
+        if compress:
+            uef = gzipwriter.GzipWriter(uef_file, level, threads, slice_size)
+        else:
+            uef = uef_file
+    else:
+        try:
+            if compress:
+                uef = gzipwriter.open(uef_file, level, threads, slice_size)
+            else:
+                uef = open(uef_file, "wb")
+        except IOError:
+            raise IOError("Failed to open the UEF file: %s" % uef_file)
+
+    try:
+        writer = ueffile.UEFWriter(uef)
+        writer.write_header(creator)
+
+        # Specify tape chunks
+        writer.start_tape()
+
+        for block in blocks:
+
+            # Each block is preceded by a gap, which is longer for the first
+            # block in a file
+            if block.number == 0:
+                summary["files"] = summary["files"] + 1
+
+            # Write the block to the UEF file
+            writer.block(block.parts or (block.block,), block.number == 0)
+            summary["bytes"] = summary["bytes"] + block.length
+
+        # Write some finishing bytes to the file
+        writer.end_tape()
+        writer.flush()
+
+    finally:
+        if isinstance(uef_file, basestring):
+            uef.close()
+        elif compress:
+            uef.finish()
+
+    if compress and stats is not None:
+        stats.add("gzip", uef.compress_seconds)
+
+    return summary
+
+
+def t2_to_uef(t2_file, uef_file, compress = 0, level = gzipwriter.DEFAULT_LEVEL,
+              verify = 0, creator = "T2UEF", limit = None, threads = None):
+
+    # Convert a T2 file to a UEF file, optionally compressed with gzip on the
+    # given number of threads. If a memory limit is given then the T2 file is
+    # read as a stream.
+
+    summary = new_summary()
+    if limit is None:
+        blocks = t2_blocks(t2_file)
+    else:
+        blocks = t2_stream(t2_file, limit)
+    blocks = monitor(blocks, summary, verify = verify)
+    return write_uef(blocks, uef_file, compress, level, creator, summary,
+                     limit = limit, threads = threads)
+
+
+def order_files(infs, names, nexts):
+
+    # Order the files so that each one is followed by the file named in its
+    # NEXT parameter. The files are linked using a dictionary of their names
+    # and each chain is then followed from its first file, so the time taken
+    # is proportional to the number of files. Chains are stored in the order
+    # of the .inf files containing their first files. Return the order as a
+    # list of positions in the lists given and a list of problems found.
+
+    # Work through the files in a consistent order
+    order = range(len(infs))
+    order.sort(key = infs.__getitem__)
+
+    problems = []
+
+    # Map each real name to the file with that name
+    files = {}
+    for i in order:
+        if files.has_key(names[i]):
+            problems.append("Files %s and %s have the same name, %s" % (
+                infs[files[names[i]]], infs[i], names[i]))
+        else:
+            files[names[i]] = i
+
+    # Link each file to the file following it
+    following = {}
+    preceding = {}
+    for i in order:
+
+        if nexts[i] == "":
+            continue
+
+        which = files.get(nexts[i])
+        if which is None:
+            problems.append("The file following %s, %s, was not found" % (
+                infs[i], nexts[i]))
+        elif preceding.has_key(which):
+            problems.append("Both %s and %s are followed by %s" % (
+                infs[preceding[which]], infs[i], nexts[i]))
+        else:
+            following[i] = which
+            preceding[which] = i
+
+    result = []
+    added = {}
+
+    def add_chain(i):
+        while i is not None and not added.has_key(i):
+            added[i] = 1
+            result.append(i)
+            i = following.get(i)
+
+    # Start with the files which do not follow any others
+    heads = filter(lambda i: not preceding.has_key(i), order)
+    for i in heads:
+        add_chain(i)
+
+    if len(heads) > 1 and following:
+        problems.append("The files form %i separate chains, starting with %s" % (
+            len(heads), string.join(map(lambda i: infs[i], heads), ", ")))
+
+    # Any remaining files are linked in cycles, which are broken at the
+    # first file found in each
+    for i in order:
+        if not added.has_key(i):
+            problems.append("The files starting with %s form a cycle" % infs[i])
+            add_chain(i)
+
+    return result, problems
+
+
+def hex2num(s):
+
+    n = 0
+
+    for i in range(0,len(s)):
+
+        a = ord(s[len(s)-i-1])
+        if (a >= 48) & (a <= 57):
+            n = n | ((a-48) << (i*4))
+        elif (a >= 65) & (a <= 70):
+            n = n | ((a-65+10) << (i*4))
+        elif (a >= 97) & (a <= 102):
+            n = n | ((a-97+10) << (i*4))
+        else:
+            raise ValueError("Bad hex: %s" % s)
+
+    return n
+
+
+def read_index(in_dir, problems = None, stats = None):
+
+    # Return the names of the files in the directory in the order they are to
+    # be stored on tape, with the real name of each, using the index.txt file
+    # if there is one or the NEXT parameters in the .inf files otherwise. Any
+    # problems found with the order are added to the list of problems if one
+    # is given.
+
+    index_file = in_dir + os.sep + "index" + suffix + "txt"
+
+    try:
+        # Examine the index file
+        lines = string.split(open(index_file, "r").read(), "\012")
+
+        index = []
+        real_names = []
+        for i in lines:
+
+            if i == "":
+                break
+
+            details = string.split(i)
+            index.append(details[0])
+            real_names.append(details[-1])
+
+        return zip(index, real_names)
+
+    except (IOError, IndexError):
+        pass
+
+    # If there is no index then look at all the .inf files and determine the
+    # order in which they are to be stored in the UEF file
+
+    # Keep all the .inf files
+    infs = []
+    for i in os.listdir(in_dir):
+        if string.lower(i[-4:]) == (suffix+"inf"):
+            infs.append(i)
+
+    # Find the file which follows each file and the real name of the file
+    nexts = []
+    names = []
+    for i in infs:
+        # Read the .inf file
+        details = string.split(open(in_dir+os.sep+i, "r").readline())
+
+        # First entry may be the name of the file assuming $.name
+        # or similar
+        if details and string.find(details[0], ".") != -1:
+            # Add the real name to the list of names
+            names.append(details[0])
+            details = details[1:]
+        else:
+            # Add the file name to the list of names
+            names.append("$."+i)
+
+        # Next two entries should be the load and execution addresses
+        details = details[2:]
+
+        if len(details) >= 2:
+            # Next file should be the last two entries in the list
+            if string.upper(details[-2]) == "NEXT":
+                # Next file
+                nexts.append(details[-1])
+            elif string.upper(details[-1][:5]) == "NEXT=":
+                # Next file
+                nexts.append(details[-1][5:])
+            else:
+                # No next file
+                nexts.append("")
+
+        elif len(details) == 1:
+            # Not enough entries for there to be a NEXT <file> entry
+            # Add to the end of the list (could be the last file)
+            if string.upper(details[-1][:5]) == "NEXT=":
+                # Next file
+                nexts.append(details[-1][5:])
+            else:
+                nexts.append("")
+        else:
+            nexts.append("")
+
+    # Determine the order of files
+    if stats is not None:
+        order, found = stats.call("order", order_files)(infs, names, nexts)
+    else:
+        order, found = order_files(infs, names, nexts)
+
+    if problems is not None:
+        problems.extend(found)
+
+    return map(lambda i: (infs[i][:-4], names[i]), order)
+
+
+def file_pieces(f, size):
+
+    # Generate the contents of an open file in pieces of the given size, each
+    # with a flag which is true for the last piece.
+
+    remaining = os.fstat(f.fileno()).st_size
+
+    while 1:
+        piece = f.read(size)
+        remaining = remaining - len(piece)
+        final = len(piece) < size or remaining <= 0
+        yield piece, final
+        if final:
+            break
+
+
+def inf_blocks(in_dir, index, summary, problems = None, stats = None,
+               limit = None):
+
+    # Generate Block objects for the files in the index, read from the
+    # directory. Files which cannot be found are added to the list of
+    # problems if one is given and are otherwise skipped. ValueError is
+    # raised if a file's load or execution address cannot be read. If a
+    # memory limit is given then each file is read in pieces whose size is
+    # set by the limit instead of all at once.
+
+    map_file = t2file.map_file
+    make_blocks = cassette.make_blocks
+    if stats is not None:
+        map_file = stats.call("read", map_file)
+        make_blocks = lambda *args: stats.iterate("encode", cassette.make_blocks(*args))
+
+    for file_name, real_name in index:
+
+        if real_name[:2] == "$.":
+            real_name = real_name[2:]
+
+        details = []
+        try:
+            details = string.split(open(in_dir + os.sep + file_name + suffix + "inf", "r").readline())
+        except IOError:
+            try:
+                details = string.split(open(in_dir + os.sep + file_name + suffix + "INF", "r").readline())
+            except IOError:
+                if problems is not None:
+                    problems.append("Couldn't find file, %s or %s" % (
+                        file_name+suffix+"inf", file_name+suffix+"INF"))
+
+        if details == []:
+            continue
+
+        try:
+            in_file = open(in_dir + os.sep + file_name, "rb")
+        except IOError:
+            if problems is not None:
+                problems.append("Couldn't find file, %s" % file_name)
+            continue
+
+        if limit is None:
+            try:
+                try:
+                    # Map or read the whole file once
+                    pieces = [(map_file(in_file), 1)]
+                finally:
+                    in_file.close()
+            except IOError:
+                if problems is not None:
+                    problems.append("Couldn't find file, %s" % file_name)
+                continue
+        else:
+            size = streams.read_size(limit)
+            pieces = file_pieces(in_file, size - size % cassette.BLOCK_SIZE)
+
+        try:
+            if string.find(details[0], ".") != -1:
+                load, exe = details[1], details[2]
+            else:
+                load, exe = details[0], details[1]
+
+            load = hex2num(load)
+            exe = hex2num(exe)
+        except (IndexError, ValueError):
+            in_file.close()
+            raise ValueError("Problem with file: %s\nInformation file may be incorrect." % (
+                in_dir + os.sep + file_name))
+
+        try:
+            number = 0
+            for data, final in pieces:
+
+                # The parts of each block are written to the UEF file without
+                # joining them
+                for block in make_blocks(
+                    data, real_name, load, exe, cassette.BLOCK_SIZE, number, final):
+
+                    summary["blocks"] = summary["blocks"] + 1
+                    yield block
+
+                number = number + len(data) // cassette.BLOCK_SIZE
+        finally:
+            in_file.close()
+
+
+def inf_to_uef(in_dir, uef_file, compress = 0, level = gzipwriter.DEFAULT_LEVEL,
+               creator = "INF2UEF", summary = None, problems = None,
+               stats = None, limit = None):
+
+    # Store the files in a directory in a UEF file, optionally compressed
+    # with gzip, in the order given by its index.txt file or the NEXT
+    # parameters in its .inf files. The UEF file may be given as a path or
+    # as an open file object, which is left open. If a memory limit is given
+    # then the files are read, and the UEF file compressed, in pieces.
+
+    if summary is None:
+        summary = new_summary()
+
+    write = write_uef
+    if stats is not None:
+        write = stats.exclusive("write", write_uef)
+
+    index = read_index(in_dir, problems, stats)
+    blocks = inf_blocks(in_dir, index, summary, problems, stats, limit)
+    return write(blocks, uef_file, compress, level, creator, summary, stats,
+                 limit)
@@ -0,0 +1,161 @@
+"""
+gzipwriter.py - Write gzip files, compressing the data on several threads.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import struct, time, zlib
+
+# The amount of data compressed as each gzip member.
+SLICE_SIZE = 1 << 20
+
+# The same default as the gzip module.
+DEFAULT_LEVEL = 9
+
+# Magic number, compression method and flags, modification time, extra
+# flags and operating system (unknown).
+MEMBER_HEADER = struct.Struct("<BBBBIBB")
+
+# CRC-32 and length of the uncompressed data.
+MEMBER_TRAILER = struct.Struct("<II")
+
+
+def compress_member(data, level, mtime):
+
+    # Compress the data as a complete gzip member. The zlib module releases
+    # the interpreter lock while compressing, so several members can be
+    # compressed at once on different threads.
+
+    if level == 9:
+        extra_flags = 2
+    elif level == 1:
+        extra_flags = 4
+    else:
+        extra_flags = 0
+
+    c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    return MEMBER_HEADER.pack(0x1f, 0x8b, 8, 0, mtime, extra_flags, 255) + \
+           c.compress(data) + c.flush() + \
+           MEMBER_TRAILER.pack(zlib.crc32(data) & 0xffffffff,
+                               len(data) & 0xffffffff)
+
+
+def timed_member(data, level, mtime):
+
+    # Compress the data as a gzip member, returning it with the time taken.
+
+    t = time.time()
+    member = compress_member(data, level, mtime)
+    return member, time.time() - t
+
+
+class GzipWriter(object):
+
+    # Writes data to a file as a series of gzip members, each compressed
+    # independently. Tools which read gzip files, including the gzip module
+    # and zlib's gzread function, treat the members as a single stream.
+
+    def __init__(self, f, level = DEFAULT_LEVEL, threads = None,
+                 slice_size = SLICE_SIZE):
+
+        self.f = f
+        self.level = level
+        self.slice_size = slice_size
+        self.mtime = int(time.time())
+
+        # The multiprocessing package is only loaded if threads are used
+        if threads is None:
+            import multiprocessing
+            threads = multiprocessing.cpu_count()
+        self.threads = threads
+
+        if threads > 1:
+            from multiprocessing.pool import ThreadPool
+            self.pool = ThreadPool(threads)
+        else:
+            self.pool = None
+
+        self.pieces = []
+        self.size = 0
+        self.pending = []
+        self.members = 0
+
+        # The time spent compressing, which may be spread across threads
+        self.compress_seconds = 0.0
+
+    def write(self, data):
+
+        if not isinstance(data, str):
+            data = str(data)
+
+        self.pieces.append(data)
+        self.size = self.size + len(data)
+
+        if self.size >= self.slice_size:
+            self._submit()
+
+    def _submit(self):
+
+        data = "".join(self.pieces)
+        self.pieces = []
+        self.size = 0
+        self.members = self.members + 1
+
+        if self.pool is None:
+            self._write(timed_member(data, self.level, self.mtime))
+            return
+
+        self.pending.append(self.pool.apply_async(
+            timed_member, (data, self.level, self.mtime)))
+
+        # Write completed members in order, keeping enough slices in hand to
+        # occupy every thread.
+        while len(self.pending) > 2 * self.threads:
+            self._write(self.pending.pop(0).get())
+
+    def _write(self, result):
+
+        member, seconds = result
+        self.f.write(member)
+        self.compress_seconds = self.compress_seconds + seconds
+
+    def finish(self):
+
+        # Write any remaining data, or an empty member if nothing was
+        # written, so that the file is always a valid gzip file, leaving the
+        # underlying file open.
+        if self.size > 0 or self.members == 0:
+            self._submit()
+
+        for result in self.pending:
+            self._write(result.get())
+        self.pending = []
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def close(self):
+
+        self.finish()
+        self.f.close()
+
+
+def open(path, level = DEFAULT_LEVEL, threads = None, slice_size = SLICE_SIZE):
+
+    return GzipWriter(file(path, "wb"), level, threads, slice_size)
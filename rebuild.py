@@ -0,0 +1,266 @@
+"""
+rebuild.py - Manifests recording the inputs and outputs of conversions, so
+             that conversions whose inputs have not changed can be skipped.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, string, sys
+
+# Determine the platform on which the program is running
+if sys.platform == "RISCOS":
+    suffix = "/"
+else:
+    suffix = "."
+
+# The first line of every manifest.
+MAGIC = "T2Tools manifest 1"
+
+# The amount of a file hashed at a time.
+READ_SIZE = 1 << 20
+
+
+def digest(path):
+
+    # Return the SHA-256 digest of the contents of a file.
+
+    import hashlib
+
+    h = hashlib.sha256()
+    f = open(path, "rb")
+    try:
+        while 1:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            h.update(data)
+    finally:
+        f.close()
+
+    return h.hexdigest()
+
+
+def fingerprint(path, previous = None):
+
+    # Return the size, modification time and digest of a file. The file is
+    # only read if there is no previous fingerprint with the same size and
+    # modification time.
+
+    info = os.stat(path)
+
+    if previous is not None:
+        size, mtime, value = previous
+        if size == info.st_size and mtime == info.st_mtime:
+            return previous
+
+    return (info.st_size, info.st_mtime, digest(path))
+
+
+def unchanged(path, previous):
+
+    # Return true if the file still has the contents described by the
+    # previous fingerprint. Files whose size has changed are not read.
+
+    try:
+        info = os.stat(path)
+    except OSError:
+        return 0
+
+    size, mtime, value = previous
+    if size != info.st_size:
+        return 0
+    if mtime == info.st_mtime:
+        return 1
+
+    # The file has been touched, but may not have changed
+    try:
+        return digest(path) == value
+    except IOError:
+        return 0
+
+
+def directory_files(path, exclude = ()):
+
+    # Return the absolute paths of the files in a directory, which are the
+    # inputs used when the directory is converted, leaving out any of the
+    # paths given to exclude, such as the manifest itself.
+
+    exclude = map(os.path.abspath, exclude)
+
+    files = []
+    for name in os.listdir(path):
+        file_path = os.path.abspath(os.path.join(path, name))
+        if os.path.isfile(file_path) and file_path not in exclude:
+            files.append(file_path)
+
+    files.sort()
+    return files
+
+
+class Entry(object):
+
+    # The conversion which created an output: the tool used, its options, the
+    # input given to it, and fingerprints of the input files read and the
+    # output files written.
+
+    __slots__ = ("tool", "options", "source", "inputs", "outputs")
+
+    def __init__(self, tool, options, source):
+
+        self.tool = tool
+        self.options = options
+        self.source = source
+        self.inputs = {}
+        self.outputs = {}
+
+
+class Manifest(object):
+
+    # A record of conversions, each identified by the absolute path of its
+    # output.
+
+    def __init__(self, path):
+
+        self.path = path
+        self.entries = {}
+
+        try:
+            lines = open(path, "r").read().split("\n")
+        except IOError:
+            return
+
+        if lines[0] != MAGIC:
+            raise ValueError("Not a manifest file: %s" % path)
+
+        entry = None
+
+        try:
+            for line in lines[1:]:
+
+                if line == "":
+                    continue
+
+                # Paths are the last field, so they may contain tabs
+                kind, rest = line.split("\t", 1)
+
+                if kind == "output":
+                    tool, options, output = rest.split("\t", 2)
+                    entry = Entry(tool, options, None)
+                    self.entries[output] = entry
+                elif kind == "source":
+                    entry.source = rest
+                elif kind in ("input", "file"):
+                    size, mtime, value, file_path = rest.split("\t", 3)
+                    record = (long(size), float(mtime), value)
+                    if kind == "input":
+                        entry.inputs[file_path] = record
+                    else:
+                        entry.outputs[file_path] = record
+                else:
+                    raise ValueError
+
+        except (ValueError, AttributeError):
+            raise ValueError("The manifest file is damaged: %s" % path)
+
+    def up_to_date(self, output, tool, options, source, inputs):
+
+        # Return true if the output was created by the tool with the same
+        # options and input, from the input files given, none of which have
+        # changed since, and all of the files it wrote are intact.
+
+        entry = self.entries.get(os.path.abspath(output))
+
+        if entry is None or entry.tool != tool or entry.options != options or \
+           entry.source != os.path.abspath(source):
+            return 0
+
+        names = entry.inputs.keys()
+        names.sort()
+        if names != inputs:
+            return 0
+
+        for file_path, previous in entry.inputs.items():
+            if not unchanged(file_path, previous):
+                return 0
+
+        for file_path, previous in entry.outputs.items():
+            if not unchanged(file_path, previous):
+                return 0
+
+        return 1
+
+    def record(self, output, tool, options, source, inputs, outputs):
+
+        # Record the conversion, reusing the previous fingerprints of input
+        # files which have not been modified.
+
+        output = os.path.abspath(output)
+        previous = self.entries.get(output)
+
+        entry = Entry(tool, options, os.path.abspath(source))
+
+        for file_path in inputs:
+            if previous is not None:
+                old = previous.inputs.get(file_path)
+            else:
+                old = None
+            entry.inputs[file_path] = fingerprint(file_path, old)
+
+        for file_path in outputs:
+            file_path = os.path.abspath(file_path)
+            entry.outputs[file_path] = fingerprint(file_path)
+
+        self.entries[output] = entry
+
+    def save(self):
+
+        # Write the manifest to a temporary file and then replace the old
+        # manifest with it.
+
+        lines = [MAGIC]
+
+        outputs = self.entries.keys()
+        outputs.sort()
+
+        for output in outputs:
+
+            entry = self.entries[output]
+            lines.append("output\t%s\t%s\t%s" % (entry.tool, entry.options, output))
+            lines.append("source\t%s" % entry.source)
+
+            for kind, files in (("input", entry.inputs), ("file", entry.outputs)):
+
+                names = files.keys()
+                names.sort()
+                for file_path in names:
+                    size, mtime, value = files[file_path]
+                    lines.append("%s\t%i\t%r\t%s\t%s" % (
+                        kind, size, mtime, value, file_path))
+
+        temp_file = self.path + suffix + "tmp"
+
+        f = open(temp_file, "w")
+        try:
+            f.write(string.join(lines, "\n") + "\n")
+        finally:
+            f.close()
+
+        try:
+            os.rename(temp_file, self.path)
+        except OSError:
+            # Platforms which cannot replace files by renaming them
+            os.remove(self.path)
+            os.rename(temp_file, self.path)
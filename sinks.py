@@ -0,0 +1,334 @@
+"""
+sinks.py - Destinations for the files extracted from tapes: a directory or a
+           tar or zip archive.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The modules for archives and hashing are imported when they are first used,
+# so that the tools start quickly when they are not needed.
+import os, sys, time
+from cStringIO import StringIO
+
+# Determine the platform on which the program is running
+if sys.platform == "RISCOS":
+    suffix = "/"
+else:
+    suffix = "."
+
+# The output formats available and the suffix added to the name of an
+# archive, or None if the output is a directory.
+formats = {"dir": None, "tar": ".tar", "tgz": ".tar.gz", "zip": ".zip"}
+
+
+class DirectorySink(object):
+
+    # Writes each file and its .inf file to a directory, which is created if
+    # it does not already exist, and records the paths of the files written.
+
+    def __init__(self, path):
+
+        self.path = path
+        self.paths = []
+
+        if not os.path.isdir(path):
+            os.mkdir(path)
+
+    def create(self, name):
+
+        path = self.path + os.sep + name
+        try:
+            f = open(path, "wb")
+        except IOError:
+            raise IOError("Failed to open the file: %s" % path)
+
+        self.paths.append(path)
+        return f
+
+    def write_inf(self, name, text):
+
+        path = self.path + os.sep + name + suffix + "inf"
+        try:
+            inf = open(path, "w")
+        except IOError:
+            raise IOError("Failed to open the information file: %s" % path)
+
+        inf.write(text)
+        inf.close()
+        self.paths.append(path)
+
+    def close(self):
+
+        pass
+
+
+class StoredFile(object):
+
+    # Writes a file to a temporary file in a content-addressed store, hashing
+    # the data as it is written, and hands it to the sink when closed.
+
+    def __init__(self, sink, name):
+
+        import hashlib, tempfile
+
+        self.sink = sink
+        self.name = name
+        self.hash = hashlib.sha256()
+
+        fd, self.temp_path = tempfile.mkstemp(suffix = suffix + "tmp",
+                                              dir = sink.store)
+        self.f = os.fdopen(fd, "wb")
+
+    def write(self, data):
+
+        self.hash.update(data)
+        self.f.write(data)
+
+    def close(self):
+
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            self.sink.add(self.name, self.temp_path, self.hash.hexdigest())
+
+
+class StoreSink(DirectorySink):
+
+    # Writes the files to a directory as hard links to copies kept in a store
+    # named by the SHA-256 digests of their contents, so that each distinct
+    # file is only stored once however many tapes it is found on. Files are
+    # copied instead if they cannot be linked. The .inf files are written to
+    # the directory as usual.
+
+    def __init__(self, path, store):
+
+        DirectorySink.__init__(self, path)
+        self.store = store
+
+        if not os.path.isdir(store):
+            try:
+                os.makedirs(store)
+            except OSError:
+                # Another process may have created it.
+                if not os.path.isdir(store):
+                    raise
+
+        # Temporary files are created with restricted permissions, so give
+        # stored files the permissions that ordinary new files would have.
+        umask = os.umask(0)
+        os.umask(umask)
+        self.mode = 0666 & ~umask
+
+        # Files added to the store and files found to be already stored
+        self.stored = 0
+        self.linked = 0
+
+    def create(self, name):
+
+        # Create the file to check that its name can be used, as the
+        # directory sink would. It is replaced by a link when complete.
+        DirectorySink.create(self, name).close()
+
+        return StoredFile(self, name)
+
+    def add(self, name, temp_path, digest):
+
+        stored_dir = os.path.join(self.store, digest[:2])
+        stored_path = os.path.join(stored_dir, digest[2:])
+
+        if os.path.exists(stored_path):
+            os.remove(temp_path)
+            self.linked = self.linked + 1
+        else:
+            if not os.path.isdir(stored_dir):
+                try:
+                    os.mkdir(stored_dir)
+                except OSError:
+                    # Another process may have created it.
+                    if not os.path.isdir(stored_dir):
+                        raise
+            os.chmod(temp_path, self.mode)
+            os.rename(temp_path, stored_path)
+            self.stored = self.stored + 1
+
+        path = self.path + os.sep + name
+        os.remove(path)
+
+        try:
+            os.link(stored_path, path)
+        except (AttributeError, OSError):
+            import shutil
+            shutil.copyfile(stored_path, path)
+
+
+class Member(object):
+
+    # Collects the contents of a file to be added to an archive, since the
+    # size of each member must be known before it is written.
+
+    def __init__(self, sink, name):
+
+        self.sink = sink
+        self.name = name
+        self.pieces = []
+
+    def write(self, data):
+
+        self.pieces.append(str(data))
+
+    def close(self):
+
+        if self.pieces is not None:
+            self.sink.add(self.name, "".join(self.pieces))
+            self.pieces = None
+
+
+class ArchiveSink(object):
+
+    # Writes each file and its .inf file as members of an archive. Subclasses
+    # provide the add method to store each member.
+
+    def __init__(self):
+
+        self.mtime = time.time()
+
+    def create(self, name):
+
+        # Names which would place the file outside the top level of the
+        # archive are refused, as a directory would refuse them.
+        if name in ("", ".", "..") or "/" in name:
+            raise IOError("Failed to add the file: %s" % name)
+
+        return Member(self, name)
+
+    def write_inf(self, name, text):
+
+        self.add(name + ".inf", text)
+
+
+class TarSink(ArchiveSink):
+
+    # Writes a tar archive, optionally compressed with gzip, to a file or to
+    # any file-like object. The archive is written as a stream, so the file
+    # object does not need to support seeking.
+
+    def __init__(self, target, compress = 0):
+
+        import tarfile
+
+        ArchiveSink.__init__(self)
+
+        if compress:
+            mode = "w|gz"
+        else:
+            mode = "w|"
+
+        if isinstance(target, basestring):
+            self.tar = tarfile.open(target, mode)
+        else:
+            self.tar = tarfile.open(fileobj = target, mode = mode)
+
+    def add(self, name, data):
+
+        import tarfile
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0644
+        self.tar.addfile(info, StringIO(data))
+
+        # The archive is only written, so there is no need to keep a record
+        # of every member added to it
+        del self.tar.members[:]
+
+    def close(self):
+
+        self.tar.close()
+
+
+class ZipSink(ArchiveSink):
+
+    # Writes a zip archive, compressing each member, to a file or a file
+    # object which supports seeking.
+
+    def __init__(self, target):
+
+        import zipfile
+
+        ArchiveSink.__init__(self)
+        self.zip = zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED)
+
+    def add(self, name, data):
+
+        import zipfile
+
+        info = zipfile.ZipInfo(name, time.localtime(self.mtime)[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0644 << 16
+        self.zip.writestr(info, data)
+
+    def close(self):
+
+        self.zip.close()
+
+
+def check_sink(path, format = "dir", store = None):
+
+    # Raise ValueError if a sink of the given format cannot be written to the
+    # path with the store given, so that the tools can report it before
+    # creating anything.
+
+    if not formats.has_key(format):
+        raise ValueError("Unknown output format: %s" % format)
+
+    if not isinstance(path, basestring):
+        if format == "dir" or store is not None:
+            raise ValueError("Only archives can be written to a file object")
+    elif store is not None:
+        if format != "dir" or path == "-":
+            raise ValueError("A store can only be used when writing to a directory")
+    elif path == "-":
+        if format not in ("tar", "tgz"):
+            raise ValueError("Only tar archives can be written to standard output")
+
+
+def open_sink(path, format = "dir", store = None):
+
+    # Return a sink of the given format writing to the path, or to standard
+    # output if the path is "-", using the content-addressed store if one is
+    # given. Archives can also be written to an open file object, which is
+    # left open when the sink is closed. ValueError is raised if the
+    # combination is not possible and IOError or OSError if the output cannot
+    # be created.
+
+    check_sink(path, format, store)
+
+    if not isinstance(path, basestring):
+        target = path
+    elif store is not None:
+        return StoreSink(path, store)
+    elif path == "-":
+        target = sys.stdout
+    else:
+        target = path
+
+    if format == "dir":
+        return DirectorySink(path)
+    elif format == "zip":
+        return ZipSink(target)
+    else:
+        return TarSink(target, format == "tgz")
@@ -0,0 +1,218 @@
+"""
+stats.py - Timers and counters describing where the tools spend their time.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys, time
+
+# The options accepted by each tool, and their descriptions.
+SYNTAX = "[--stats] [--json <stats file>] [--profile <profile file>]"
+
+HELP = [
+    "--stats         Prints the time spent in each stage of the conversion and the",
+    "                amounts of data processed when finished.",
+    "--json <stats file>",
+    "                Writes the statistics to <stats file> in JSON format.",
+    "--profile <profile file>",
+    "                Records a profile of the conversion in <profile file> for",
+    "                use with the pstats module."
+    ]
+
+
+class Stats(object):
+
+    # Accumulates the time spent in each stage of a conversion and counts of
+    # the data processed. The tools only create a Stats object when one of
+    # the options is given, and only wrap their functions and generators
+    # when they have one, so there is no cost otherwise.
+
+    def __init__(self, tool, text = 0, json_file = None, profile_file = None):
+
+        self.tool = tool
+        self.text = text
+        self.json_file = json_file
+        self.profile_file = profile_file
+
+        self.stages = []
+        self.timers = {}
+        self.counters = {}
+
+        # Time recorded for any stage, used to exclude the time spent in
+        # other stages from the stage enclosing them.
+        self.recorded = 0.0
+
+        self.profiler = None
+        if profile_file is not None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.started = time.time()
+        self.seconds = None
+
+    def add(self, stage, seconds):
+
+        if not self.timers.has_key(stage):
+            self.stages.append(stage)
+            self.timers[stage] = 0.0
+
+        self.timers[stage] = self.timers[stage] + seconds
+        self.recorded = self.recorded + seconds
+
+    def count(self, name, value = 1):
+
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def counts(self, summary):
+
+        # Record the values in a summary returned by the convert module.
+        for name, value in summary.items():
+            self.counters[name] = value
+
+    def call(self, stage, function):
+
+        # Return a version of the function which records the time spent in
+        # it under the given stage.
+
+        def timed(*args, **kw):
+            t = time.time()
+            try:
+                return function(*args, **kw)
+            finally:
+                self.add(stage, time.time() - t)
+
+        return timed
+
+    def exclusive(self, stage, function):
+
+        # Return a version of the function which records the time spent in
+        # it, less the time recorded for other stages while it runs, such as
+        # reading the items from a generator passed to it.
+
+        def timed(*args, **kw):
+            t = time.time()
+            recorded = self.recorded
+            try:
+                return function(*args, **kw)
+            finally:
+                inner = self.recorded - recorded
+                self.add(stage, time.time() - t - inner)
+
+        return timed
+
+    def iterate(self, stage, iterable, counter = None):
+
+        # Generate the items from the iterable, recording the time taken to
+        # produce them under the given stage and counting them if a counter
+        # name is given.
+
+        items = iter(iterable)
+
+        while 1:
+            t = time.time()
+            try:
+                item = items.next()
+            finally:
+                self.add(stage, time.time() - t)
+
+            if counter is not None:
+                self.count(counter)
+
+            yield item
+
+    def finish(self, stream = sys.stderr):
+
+        # Stop the profiler and write the statistics.
+
+        self.seconds = time.time() - self.started
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+
+        if self.text:
+            self.report(stream)
+
+        if self.json_file is not None:
+            import json
+            f = open(self.json_file, "w")
+            json.dump(self.as_dict(), f, indent = 2, sort_keys = True,
+                      separators = (",", ": "))
+            f.write("\n")
+            f.close()
+
+    def throughput(self):
+
+        # Return the rates at which the input was read and the file data was
+        # processed, in megabytes per second.
+
+        rates = {}
+        if self.seconds > 0:
+            for rate, name in (("input", "input bytes"), ("file data", "bytes")):
+                if self.counters.has_key(name):
+                    rates[rate] = self.counters[name] / (self.seconds * 1048576.0)
+
+        return rates
+
+    def as_dict(self):
+
+        return {"tool": self.tool, "seconds": self.seconds,
+                "stages": self.timers, "counters": self.counters,
+                "MB/s": self.throughput()}
+
+    def report(self, stream):
+
+        stream.write("%s statistics:\n" % self.tool)
+        stream.write("  %-20s %10.3f s\n" % ("total", self.seconds))
+
+        for stage in self.stages:
+            if self.seconds > 0:
+                share = 100.0 * self.timers[stage] / self.seconds
+            else:
+                share = 0.0
+            stream.write("  %-20s %10.3f s %5.1f%%\n" % (
+                stage, self.timers[stage], share))
+
+        names = self.counters.keys()
+        names.sort()
+        for name in names:
+            stream.write("  %-20s %10i\n" % (name, self.counters[name]))
+
+        rates = self.throughput()
+        for rate in ("input", "file data"):
+            if rates.has_key(rate):
+                stream.write("  %-20s %10.2f MB/s\n" % (rate, rates[rate]))
+
+
+def from_match(tool, match):
+
+    # Return a Stats object for the options given on the command line, or
+    # None if statistics are not required.
+
+    if not (match.has_key("stats") or match.has_key("json") or
+            match.has_key("profile")):
+        return None
+
+    json_file = None
+    if match.has_key("json"):
+        json_file = match["stats file"]
+
+    profile_file = None
+    if match.has_key("profile"):
+        profile_file = match["profile file"]
+
+    return Stats(tool, match.has_key("stats"), json_file, profile_file)
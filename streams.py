@@ -0,0 +1,397 @@
+"""
+streams.py - Read files through buffers of a fixed size, so that tape files
+             of any size can be converted in a bounded amount of memory.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import string, zlib
+import gzipwriter
+
+# The memory limit used when none is given.
+DEFAULT_LIMIT = 1 << 20
+
+# The smallest memory limit accepted. Half of the limit is used to read the
+# input, which must be able to hold the largest block or tape data chunk: a
+# block holds at most 65535 bytes of data, which take up 81920 bytes of an
+# explicit tape data chunk.
+MIN_LIMIT = 1 << 18
+
+# Suffixes accepted by parse_size.
+UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+# The flags in a gzip member header.
+FHCRC, FEXTRA, FNAME, FCOMMENT = 2, 4, 8, 16
+
+# The command line option used by the tools to request streaming.
+SYNTAX = "[--stream <memory limit>]"
+
+HELP = [
+    "--stream <memory limit>",
+    "                Reads the input as a stream through buffers which use no",
+    "                more than <memory limit> bytes in total, which may be",
+    "                followed by K, M or G and must be at least 256K, so that",
+    "                the memory used does not grow with the size of the input."
+    ]
+
+
+def parse_size(text):
+
+    # Return the number of bytes given by a number with an optional K, M or
+    # G suffix, raising ValueError if it cannot be read.
+
+    text = string.upper(string.strip(text))
+    unit = text[-1:]
+
+    if UNITS.has_key(unit) and unit != "":
+        text = text[:-1]
+    else:
+        unit = ""
+
+    return int(text) * UNITS[unit]
+
+
+def check_limit(limit):
+
+    # Return the memory limit given, or the default if it is None, raising
+    # ValueError if it is too small.
+
+    if limit is None:
+        return DEFAULT_LIMIT
+
+    if limit < MIN_LIMIT:
+        raise ValueError("The memory limit must be at least %iK." % (MIN_LIMIT >> 10))
+
+    return limit
+
+
+def from_match(match):
+
+    # Return the memory limit given on the command line, or None if the
+    # input is not to be streamed, raising ValueError if it is not valid.
+
+    if not match.has_key("stream"):
+        return None
+
+    try:
+        limit = parse_size(match["memory limit"])
+    except ValueError:
+        raise ValueError("The memory limit must be a number of bytes.")
+
+    return check_limit(limit)
+
+
+def read_size(limit):
+
+    # Return the size of the buffer used to read the input for a memory
+    # limit, leaving the rest for decompressing the input and compressing the
+    # output.
+
+    return check_limit(limit) // 2
+
+
+def write_size(limit):
+
+    # Return the amount of output compressed at once for a memory limit.
+
+    return check_limit(limit) // 4
+
+
+class GunzipReader(object):
+
+    # Reads the decompressed contents of a gzip file, which may contain
+    # several members, from a file object which only needs a read method, so
+    # pipes can be read. No more than the amount requested is decompressed
+    # at once. The CRC and length in the trailer of each member are checked
+    # against the data decompressed, and IOError is raised, once the data
+    # decompressed so far has been read, if the file ends part of the way
+    # through a member or is corrupt.
+
+    def __init__(self, f, start = "", read_size = 1 << 16):
+
+        self.f = f
+        self.read_size = read_size
+        self.pending = start
+        self.decompressor = None
+        self.trailer = 0
+        self.output = ""
+        self.error = None
+        self.eof = 0
+
+    def _fill(self, n):
+
+        # Read more of the input until at least n bytes are pending, returning
+        # whether there are enough.
+
+        while len(self.pending) < n:
+            data = self.f.read(self.read_size)
+            if not data:
+                return 0
+            self.pending = self.pending + data
+
+        return 1
+
+    def _find(self, s, start):
+
+        # Return the position of a byte in the pending input, after the start
+        # position, reading more of the input until it is found.
+
+        while 1:
+            found = self.pending.find(s, start)
+            if found != -1 or not self._fill(len(self.pending) + 1):
+                return found
+
+    def _start_member(self):
+
+        # Read the header of a member, returning false if the input ends
+        # cleanly before it.
+
+        # Members may be separated by padding
+        self.pending = self.pending.lstrip("\000")
+        while not self.pending:
+            if not self._fill(1):
+                return 0
+            self.pending = self.pending.lstrip("\000")
+
+        if not self._fill(gzipwriter.MEMBER_HEADER.size):
+            raise IOError("The input file ends in the header of a gzip member")
+
+        id1, id2, method, flags = gzipwriter.MEMBER_HEADER.unpack_from(self.pending)[:4]
+        if (id1, id2, method) != (0x1f, 0x8b, 8):
+            raise IOError("The input file is not a valid gzip file")
+
+        pos = gzipwriter.MEMBER_HEADER.size
+
+        if flags & FEXTRA:
+            if not self._fill(pos + 2):
+                raise IOError("The input file ends in the header of a gzip member")
+            pos = pos + 2 + (ord(self.pending[pos]) | (ord(self.pending[pos+1]) << 8))
+
+        for flag in FNAME, FCOMMENT:
+            if flags & flag:
+                found = self._find("\000", pos)
+                if found == -1:
+                    raise IOError("The input file ends in the header of a gzip member")
+                pos = found + 1
+
+        if flags & FHCRC:
+            pos = pos + 2
+
+        if not self._fill(pos):
+            raise IOError("The input file ends in the header of a gzip member")
+
+        self.pending = self.pending[pos:]
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.crc = 0
+        self.length = 0
+        return 1
+
+    def _end_member(self):
+
+        # Check the trailer of the member just decompressed.
+
+        if not self._fill(gzipwriter.MEMBER_TRAILER.size):
+            raise IOError("The input file ends before the end of a gzip member")
+
+        crc, length = gzipwriter.MEMBER_TRAILER.unpack_from(self.pending)
+        if crc != self.crc & 0xffffffff or length != self.length & 0xffffffff:
+            raise IOError("The input file is corrupt: a gzip member has the wrong CRC or length")
+
+        self.pending = self.pending[gzipwriter.MEMBER_TRAILER.size:]
+        self.trailer = 0
+
+    def _decompress(self, size):
+
+        # Return up to size bytes from the current member.
+
+        if not self.pending and not self._fill(1):
+            # Collect any output held by the decompressor before reporting
+            # that the member is incomplete
+            self.decompressor = None
+            self.error = "The input file ends before the end of a gzip member"
+            return ""
+
+        try:
+            data = self.decompressor.decompress(self.pending, size)
+        except zlib.error:
+            raise IOError("The input file is not a valid gzip file")
+
+        if self.decompressor.unused_data:
+            # The compressed data has ended and the trailer follows it
+            self.pending = self.decompressor.unused_data
+            self.decompressor = None
+            self.trailer = 1
+        else:
+            self.pending = self.decompressor.unconsumed_tail
+
+        self.crc = zlib.crc32(data, self.crc)
+        self.length = self.length + len(data)
+        return data
+
+    def read(self, size):
+
+        pieces = []
+        requested = size
+
+        while size > 0:
+
+            if self.output:
+                data = self.output[:size]
+                self.output = self.output[size:]
+
+            elif self.error:
+                # Report the error after the data read before it
+                if size < requested:
+                    break
+                raise IOError(self.error)
+
+            elif self.eof:
+                break
+
+            elif self.trailer:
+                self._end_member()
+                continue
+
+            elif self.decompressor is None:
+                if not self._start_member():
+                    self.eof = 1
+                continue
+
+            else:
+                decompressor = self.decompressor
+                data = self._decompress(size)
+                if self.error:
+                    self.output = decompressor.flush()
+
+            pieces.append(data)
+            size = size - len(data)
+
+        return "".join(pieces)
+
+
+class Window(object):
+
+    # A view of part of a file, read into a buffer of a fixed size which is
+    # reused as the window moves through the file. The data in the window
+    # starts at pos in the buffer and ends at end; offset is the position in
+    # the file of the start of the window.
+
+    def __init__(self, f, size, start = ""):
+
+        self.f = f
+        self.size = size
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.buf[:len(start)] = start
+        self.pos = 0
+        self.end = len(start)
+        self.offset = 0
+        self.eof = 0
+
+        if hasattr(f, "readinto"):
+            self._read = self._readinto
+        else:
+            self._read = self._read_string
+
+    def _readinto(self, pos):
+
+        return self.f.readinto(self.view[pos:]) or 0
+
+    def _read_string(self, pos):
+
+        data = self.f.read(self.size - pos)
+        self.buf[pos:pos+len(data)] = data
+        return len(data)
+
+    def ensure(self, n):
+
+        # Make at least n bytes available in the window if possible, moving
+        # the data to the start of the buffer to make room for more, and
+        # return the number available.
+
+        if self.end - self.pos >= n:
+            return self.end - self.pos
+
+        if n > self.size:
+            raise IOError("The input needs more memory than the limit allows")
+
+        if self.pos > 0:
+            remaining = self.end - self.pos
+            self.buf[:remaining] = self.buf[self.pos:self.end]
+            self.pos = 0
+            self.end = remaining
+
+        while self.end < n and not self.eof:
+            read = self._read(self.end)
+            if read == 0:
+                self.eof = 1
+            self.end = self.end + read
+
+        return self.end - self.pos
+
+    def peek(self, n, start = 0):
+
+        # Return a copy of n bytes of the window, starting at the given
+        # offset from the start of the window, without moving it.
+
+        start = self.pos + start
+        return self.view[start:start+n].tobytes()
+
+    def find(self, s, start = 0):
+
+        # Return the offset from the start of the window of the first
+        # occurrence of a byte within it, or -1 if it is not found.
+
+        found = self.buf.find(s, self.pos + start, self.end)
+        if found == -1:
+            return -1
+
+        return found - self.pos
+
+    def take(self, n):
+
+        # Return a copy of n bytes from the start of the window, or fewer if
+        # the file ends, and move the window past them.
+
+        available = self.ensure(n)
+        if n > available:
+            n = available
+
+        data = self.view[self.pos:self.pos+n].tobytes()
+        self.pos = self.pos + n
+        self.offset = self.offset + n
+        return data
+
+    def skip(self, n):
+
+        # Move the window past n bytes, reading and discarding any which are
+        # not yet in the buffer, and return the number skipped.
+
+        skipped = 0
+
+        while n > 0:
+
+            available = self.ensure(min(n, self.size))
+            if available == 0:
+                break
+
+            step = min(n, available)
+            self.pos = self.pos + step
+            self.offset = self.offset + step
+            skipped = skipped + step
+            n = n - step
+
+        return skipped
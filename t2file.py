@@ -0,0 +1,313 @@
+"""
+t2file.py - Shared routines for reading Slogger T2 files.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import mmap, string, sys
+import cassette
+
+# Every byte in a T2 file is stored exclusive-ORed with this value.
+XOR_KEY = 90
+
+# Translation table which undoes (or applies) the obfuscation for a whole
+# string at once.
+XOR_TABLE = string.maketrans("".join(map(chr, range(256))),
+                             "".join([chr(i ^ XOR_KEY) for i in range(256)]))
+
+
+def decode(s):
+
+    # Decode a whole string (or bytearray) in one pass.
+    return s.translate(XOR_TABLE)
+
+
+# The size of the header fields following the name, including the CRC.
+HEADER_SIZE = cassette.HEADER.size + cassette.CRC.size
+
+# The decoded alignment character that marks the end of a T2 file.
+END_MARKER = 0x2b
+
+# The byte that terminates each file name, as stored in the file.
+NAME_END = chr(XOR_KEY)
+
+# The amount of the file decoded by each task when blocks are decoded in
+# parallel.
+BATCH_SIZE = 1 << 20
+
+
+def map_file(f):
+
+    # Map the whole of an open file into memory, falling back to reading it
+    # if it cannot be mapped (empty files, pipes, and so on). Files which
+    # cannot be rewound are read from their current position.
+    try:
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError):
+        try:
+            f.seek(0, 0)
+        except (AttributeError, IOError):
+            pass
+        return f.read()
+
+
+def read_blocks(data, pos = 5, headers_only = 0):
+
+    # Generate Block objects for the blocks in a mapped T2 file, skipping the
+    # five byte file header. Each block is decoded in a single operation
+    # unless only the headers are required.
+
+    length = len(data)
+
+    while pos < length:
+
+        start = pos
+
+        # Check the alignment character
+        if ord(data[pos]) ^ XOR_KEY == END_MARKER:
+            break
+
+        # Find the end of the name without decoding it
+        name_end = data.find(NAME_END, pos + 1)
+        if name_end == -1:
+            raise IOError("Unexpected end of file")
+
+        name = decode(data[pos+1:name_end])
+
+        pos = name_end + 1
+        header = decode(data[pos:pos+HEADER_SIZE])
+        if len(header) < HEADER_SIZE:
+            raise IOError("Unexpected end of file")
+
+        load, exec_addr, block_number, block_length, block_flag, next_addr = \
+            cassette.HEADER.unpack_from(header)
+        header_crc = cassette.CRC.unpack_from(header, cassette.HEADER.size)[0]
+
+        pos = pos + HEADER_SIZE
+        offset = pos - start
+
+        # Blocks containing data are followed by a block CRC
+        if block_length > 0:
+            pos = pos + block_length + cassette.CRC.size
+
+        if pos > length:
+            raise IOError("Unexpected end of file")
+
+        if headers_only:
+            block = None
+        else:
+            block = decode(data[start:pos])
+
+        yield cassette.Block(name, load, exec_addr, block_number, block_length,
+                             block_flag, next_addr, header_crc, block, offset,
+                             start)
+
+
+def stream_blocks(window):
+
+    # Generate the same blocks as read_blocks from a T2 file read through a
+    # window from the streams module, so that only the window and the block
+    # being decoded are held in memory.
+
+    window.skip(5)
+
+    while window.ensure(cassette.NAME_SEARCH + HEADER_SIZE) > 0:
+
+        start = window.offset
+
+        # Check the alignment character
+        if ord(window.peek(1)) ^ XOR_KEY == END_MARKER:
+            break
+
+        # Find the end of the name without decoding it
+        name_end = window.find(NAME_END, 1)
+        if name_end == -1:
+            window.ensure(window.size)
+            name_end = window.find(NAME_END, 1)
+            if name_end == -1:
+                raise IOError("Unexpected end of file")
+
+        offset = name_end + 1 + HEADER_SIZE
+        if window.ensure(offset) < offset:
+            raise IOError("Unexpected end of file")
+
+        header = decode(window.peek(HEADER_SIZE, name_end + 1))
+        block_length = cassette.HEADER.unpack_from(header)[3]
+
+        # Blocks containing data are followed by a block CRC
+        end = offset
+        if block_length > 0:
+            end = end + block_length + cassette.CRC.size
+
+        if window.ensure(end) < end:
+            raise IOError("Unexpected end of file")
+
+        block = cassette.parse_block(decode(window.take(end)))
+        block.position = start
+        yield block
+
+
+def block_end(block):
+
+    # Return the position in the T2 file following a block which was read
+    # with only its header.
+
+    end = block.position + block.offset
+    if block.length > 0:
+        end = end + block.length + cassette.CRC.size
+
+    return end
+
+
+def read_data(data, block):
+
+    # Decode the whole of a block which was read with only its header, using
+    # its position in the mapped T2 file, and return it.
+
+    block.block = decode(data[block.position:block_end(block)])
+    return block
+
+
+# The mapped file being read by a pool of processes and the anonymous map
+# that they decode it into, both of which are inherited by the processes when
+# they are created instead of being sent to them.
+shared_data = None
+shared_output = None
+
+def decode_range(task):
+
+    # Decode the part of the shared file containing a series of consecutive
+    # blocks, given by their start and end positions, into the same part of
+    # the shared output. If requested, return a list of the results of
+    # checking the CRCs of each block; the decoded data itself is never sent
+    # back.
+
+    start, end, bounds, verify = task
+    decoded = decode(shared_data[start:end])
+    shared_output[start:end] = decoded
+
+    if not verify:
+        return None
+
+    checks = []
+    for first, last in bounds:
+        checks.append(cassette.check_block(
+            buffer(decoded, first - start, last - first)))
+
+    return checks
+
+
+def read_blocks_parallel(data, processes = None, verify = 0,
+                         batch_size = BATCH_SIZE, headers = None):
+
+    # Generate the same blocks as read_blocks in two phases: first find the
+    # boundaries of the blocks by reading only their headers, then decode
+    # batches of consecutive blocks, and check their CRCs if verify is set,
+    # using a pool of processes. The processes write the decoded data into an
+    # anonymous map created before they are forked, so the blocks produced
+    # here, in their original order, only refer to parts of it. A sequence of
+    # header-only blocks can be given to read only those blocks. The pool
+    # relies on the processes being forked, so the blocks are read serially
+    # on platforms where they are not.
+
+    global shared_data, shared_output
+
+    if processes is None:
+        import multiprocessing
+        processes = multiprocessing.cpu_count()
+
+    if processes <= 1 or sys.platform == "win32":
+        if headers is None:
+            for block in read_blocks(data):
+                yield block
+        else:
+            for block in headers:
+                yield read_data(data, block)
+        return
+
+    # Find the blocks, keeping any error to report after the blocks before
+    # it have been produced, as read_blocks does
+    if headers is None:
+        headers = read_blocks(data, headers_only = 1)
+
+    found = []
+    error = None
+    try:
+        for block in headers:
+            found.append(block)
+    except IOError, error:
+        pass
+
+    headers = found
+
+    # Divide the blocks into batches of consecutive blocks
+    batches = []
+    tasks = []
+    i = 0
+    while i < len(headers):
+
+        start = headers[i].position
+        batch = []
+        bounds = []
+
+        while i < len(headers) and (not batch or
+                                    block_end(headers[i]) - start <= batch_size):
+            block = headers[i]
+            batch.append(block)
+            bounds.append((block.position, block_end(block)))
+            i = i + 1
+
+        batches.append(batch)
+        tasks.append((start, bounds[-1][1], bounds, verify))
+
+    if tasks:
+
+        import multiprocessing
+
+        output = mmap.mmap(-1, max([task[1] for task in tasks]))
+
+        shared_data = data
+        shared_output = output
+        try:
+            pool = multiprocessing.Pool(min(processes, len(tasks)))
+        finally:
+            shared_data = None
+            shared_output = None
+
+        try:
+            results = pool.imap(decode_range, tasks)
+
+            for batch, (start, end, bounds, verify) in zip(batches, tasks):
+
+                checks = results.next()
+
+                for j in range(len(batch)):
+                    block = batch[j]
+                    first, last = bounds[j]
+                    block.block = buffer(output, first, last - first)
+                    if checks is not None:
+                        block.checked = checks[j]
+                    yield block
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+
+        pool.join()
+
+    if error is not None:
+        raise error
@@ -0,0 +1,575 @@
+"""
+ueffile.py - Shared routines for reading and writing UEF files.
+
+Copyright (c) 2000-2010, David Boddie <david@boddie.org.uk>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import binascii, mmap, string, struct
+import cassette, streams
+
+MAGIC = "UEF File!\000"
+
+# The size of the file header, including the version numbers.
+HEADER_SIZE = len(MAGIC) + 2
+
+# Chunk ID and length.
+CHUNK_HEADER = struct.Struct("<HI")
+
+# Chunks containing tape data: implicit (0x100), explicit (0x102) and defined
+# format (0x104) data, and security cycles (0x114).
+TAPE_CHUNKS = (0x100, 0x102, 0x104, 0x114)
+
+# The number of data bits, parity and number of stop bits at the start of a
+# defined format tape data chunk.
+DEFINED_FORMAT = struct.Struct("<Bcb")
+
+# The number of cycles and the kinds of the first and last pulses at the
+# start of a security cycles chunk.
+SECURITY_CYCLES = struct.Struct("<HBcc")
+
+# A chunk holding a single 16-bit value, such as a gap chunk holding its
+# length.
+GAP_CHUNK = struct.Struct("<HIH")
+
+# A gap chunk followed by the header of a tape data chunk.
+GAP_AND_BLOCK = struct.Struct("<HIHHI")
+
+# The lengths of the gaps written before the first and later blocks in a file.
+LONG_GAP = 0x05dc
+SHORT_GAP = 0x0258
+
+# The amount of output collected by UEFWriter before it is written.
+BATCH_SIZE = 1 << 16
+
+# The number of bytes at the start of an explicit tape data chunk which hold
+# enough frames to contain the header of a block with a name of the usual
+# length, including the byte giving the number of excess bits.
+HEADER_FRAMES_SIZE = 1 + ((cassette.NAME_SEARCH + cassette.HEADER_AND_CRC.size) * 10 + 7) // 8
+
+
+class PartialData(str):
+
+    # The data decompressed from a gzipped file before an error was found in
+    # it, with the error to report once the blocks it contains have been read.
+
+    error = None
+
+
+def read_data(f):
+
+    # Return the contents of an open UEF file, mapped into memory if it is
+    # uncompressed or decompressed in one pass if it is gzipped, so pipes
+    # can be read. If a gzipped file is truncated or corrupt then the data
+    # decompressed before the problem is returned as PartialData.
+
+    start = f.read(len(MAGIC))
+
+    if start == MAGIC:
+        try:
+            return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            return start + f.read()
+
+    reader = streams.GunzipReader(f, start)
+    pieces = []
+
+    try:
+        while 1:
+            piece = reader.read(1 << 20)
+            if not piece:
+                break
+            pieces.append(piece)
+    except IOError, e:
+        data = PartialData("".join(pieces))
+        data.error = str(e)
+        return data
+
+    return "".join(pieces)
+
+
+def map_file(path):
+
+    # Return the contents of a UEF file, given as a path or an open file
+    # object, together with the minor and major version numbers of the file
+    # format. Files opened here are closed again; file objects are left open.
+    # IOError is raised if the file cannot be opened and ValueError if it is
+    # not a UEF file.
+
+    if isinstance(path, basestring):
+        f = open(path, "rb")
+        try:
+            data = read_data(f)
+        finally:
+            f.close()
+    else:
+        data = read_data(path)
+        path = getattr(path, "name", "<file>")
+
+    if len(data) < HEADER_SIZE or data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a UEF file: %s" % path)
+
+    # Read version number of the file format
+    return data, ord(data[len(MAGIC)]), ord(data[len(MAGIC)+1])
+
+
+def index_chunks(data, pos = HEADER_SIZE):
+
+    # Build a list of the ID, data offset and length of each chunk in one
+    # pass over the chunk headers, without reading the chunk contents. The
+    # length of a truncated final chunk is reduced to fit the data.
+
+    index = []
+    append = index.append
+    unpack_from = CHUNK_HEADER.unpack_from
+    header_size = CHUNK_HEADER.size
+    end = len(data)
+
+    while pos + header_size <= end:
+
+        chunk_id, length = unpack_from(data, pos)
+        pos = pos + header_size
+
+        if pos + length > end:
+            length = end - pos
+
+        append((chunk_id, pos, length))
+        pos = pos + length
+
+    return index
+
+
+def read_chunks(data, index = None, ids = None):
+
+    # Generate the chunk ID and a view of the data of each chunk in the
+    # index, or only those with IDs in the given sequence. Skipped chunks are
+    # not read at all.
+
+    if index is None:
+        index = index_chunks(data)
+
+    for chunk_id, offset, length in index:
+
+        if ids is None or chunk_id in ids:
+            yield chunk_id, buffer(data, offset, length)
+
+
+# Translation tables used to shift every byte in a string at once.
+shift_tables = {}
+
+def shift_table(shift, mask):
+
+    # Return a table which shifts bytes right by the given number of bits, or
+    # left for negative values, and masks the result.
+
+    key = (shift, mask)
+    if not shift_tables.has_key(key):
+
+        if shift >= 0:
+            values = [(i >> shift) & mask for i in range(256)]
+        else:
+            values = [(i << -shift) & mask for i in range(256)]
+
+        shift_tables[key] = string.maketrans("".join(map(chr, range(256))),
+                                             "".join(map(chr, values)))
+
+    return shift_tables[key]
+
+
+def or_strings(s1, s2):
+
+    # Combine two strings of equal length with a bitwise OR of each pair of
+    # bytes, using long integers to process the whole strings at once.
+
+    value = long(binascii.hexlify(s1), 16) | long(binascii.hexlify(s2), 16)
+    return binascii.unhexlify("%0*x" % (len(s1) * 2, value))
+
+
+def gcd(a, b):
+
+    while b:
+        a, b = b, a % b
+
+    return a
+
+
+def frame_bytes(data, start, end, frame_size, data_bits = 8):
+
+    # Extract the data from the frames stored in the bits of the data between
+    # the start and end bit positions, where bit 0 of the first byte is the
+    # first bit on the tape. Each frame has a start bit followed by data_bits
+    # data bits (least significant first) and any parity or stop bits needed
+    # to make up frame_size bits. Return the data as a string.
+
+    # Only include frames which contain all of their data bits.
+    count = max(0, (end - start - data_bits - 1) // frame_size + 1)
+    if count == 0:
+        return ""
+
+    # The arrangement of frames within the bytes repeats every period bytes,
+    # so the bytes containing the same part of each frame can be collected
+    # with an extended slice, shifted into place with a translation table
+    # and combined with the bytes holding the rest of the frame.
+    period_bits = frame_size * 8 // gcd(frame_size, 8)
+    period = period_bits // 8
+    frames = period_bits // frame_size
+
+    mask = (1 << data_bits) - 1
+
+    # Allow the byte following the last frame to be read.
+    data = data + "\000"
+    out = bytearray(count)
+
+    for k in range(min(frames, count)):
+
+        n = (count - k + frames - 1) // frames
+
+        pos = start + 1 + (k * frame_size)
+        first = pos >> 3
+        shift = pos & 7
+        last = first + (n - 1) * period + 1
+
+        column = data[first:last:period].translate(shift_table(shift, mask))
+
+        if shift + data_bits > 8:
+            rest = data[first+1:last+1:period]
+            column = or_strings(column, rest.translate(shift_table(shift - 8, mask)))
+
+        out[k::frames] = column
+
+    return str(out)
+
+
+def explicit_bits(data, minor, major, complete = 1):
+
+    # Convert the contents of a tape data chunk with start and stop bits
+    # (0x102) to the implicit format used by 0x100 chunks. If the data is
+    # only the start of a chunk then complete should be false, so that the
+    # number of excess bits at the end of the chunk is not applied to it.
+
+    if major == 0 and minor < 9:
+
+        # For UEF file versions earlier than 0.9, the number of
+        # excess bits to be ignored at the end of the stream is
+        # set to zero implicitly
+        ignore = 0
+        start = 0
+    else:
+        # For later versions, the number of excess bits is
+        # specified in the first byte of the stream
+        if not data:
+            return ""
+        ignore = ord(data[0])
+        start = 8
+
+    if not complete:
+        ignore = 0
+
+    # Each byte is framed by a start bit and a stop bit
+    return frame_bytes(data, start, len(data) * 8 - ignore, 10)
+
+
+def defined_format(data, offset = 0, length = None):
+
+    # Return the contents of a defined format tape data chunk (0x104), found
+    # at the given offset in the data, in the implicit format used by 0x100
+    # chunks. Each packet is already stored as a byte, with the start, parity
+    # and stop bits described only by the chunk header, so eight bit packets
+    # are returned as a view of the data without copying them and smaller
+    # ones are masked with a translation table.
+
+    if length is None:
+        length = len(data) - offset
+
+    if length < DEFINED_FORMAT.size:
+        return ""
+
+    bits = DEFINED_FORMAT.unpack_from(data, offset)[0]
+    start = offset + DEFINED_FORMAT.size
+    length = length - DEFINED_FORMAT.size
+
+    if bits >= 8:
+        return buffer(data, start, length)
+
+    return data[start:start+length].translate(shift_table(0, (1 << bits) - 1))
+
+
+def security_cycles(data):
+
+    # Convert the contents of a security cycles chunk (0x114) to the implicit
+    # format used by 0x100 chunks. Each bit of the chunk, most significant
+    # first, records a cycle at either the high (1) or low (0) frequency; a
+    # 0 bit on the tape is one low cycle and a 1 bit is two high cycles. The
+    # cycles are converted to bits and the bytes framed by them are read
+    # from the first start bit onwards.
+
+    if len(data) < SECURITY_CYCLES.size:
+        return ""
+
+    low, high, first, last = SECURITY_CYCLES.unpack_from(data)
+    count = low | (high << 16)
+    cycles = data[SECURITY_CYCLES.size:]
+
+    # Expand the cycles into a string of digits in one operation
+    if not cycles:
+        return ""
+    text = bin(long(binascii.hexlify(cycles), 16))[2:].zfill(len(cycles) * 8)
+    text = text[:count]
+
+    # A single pulse at either end is only half a cycle
+    if first == "P":
+        text = text[1:]
+    if last == "P":
+        text = text[:-1]
+
+    # Pair up the high cycles, dropping any left over, and skip the carrier
+    # tone before the first start bit
+    text = text.replace("11", "2").replace("1", "").replace("2", "1")
+    text = text[text.find("0"):]
+    if not text or text[0] != "0":
+        return ""
+
+    # Pack the bits into bytes with the first bit on the tape in bit 0 of
+    # the first byte, as in explicit tape data chunks
+    n = len(text)
+    size = (n + 7) // 8
+    packed = binascii.unhexlify("%0*x" % (size * 2, long(text[::-1], 2)))[::-1]
+
+    return frame_bytes(packed, 0, n, 10)
+
+
+def tape_data(chunk_id, data, minor, major):
+
+    # Return the contents of any tape data chunk in the implicit format used
+    # by 0x100 chunks.
+
+    if chunk_id == 0x100:
+        return data
+    elif chunk_id == 0x102:
+        return explicit_bits(data, minor, major)
+    elif chunk_id == 0x104:
+        return defined_format(data)
+    else:
+        return security_cycles(data)
+
+
+def checked_block(data):
+
+    # Return a Block object for a block decoded from a defined format or
+    # security cycles chunk, or None if the data is not a block. These chunks
+    # are often used for copy protection instead of holding blocks, so only
+    # data starting with the synchronisation byte and with an intact header
+    # CRC is accepted.
+
+    if data[:1] != "*" or not cassette.check_block(data)[0]:
+        return None
+
+    return cassette.parse_block(data)
+
+
+def read_blocks(data, minor, major, index = None, headers_only = 0):
+
+    # Generate Block objects for the tape blocks stored in the file. The
+    # position of each block is the offset of its chunk data in the file,
+    # after decompression. Blocks stored as implicit tape data refer to the
+    # file data without copying it, so their payloads can be written
+    # straight from the mapped file. If only the headers are required then
+    # only the start of each explicit tape data chunk is converted and the
+    # blocks contain no data.
+
+    if index is None:
+        index = index_chunks(data)
+
+    for chunk_id, offset, length in index:
+
+        if chunk_id not in TAPE_CHUNKS or length <= 1:
+            continue
+
+        # Implicit and defined format tape data chunks contain the block as a
+        # series of bytes; others need to be converted first
+        if chunk_id == 0x100:
+            block = cassette.parse_block(buffer(data, offset, length))
+
+        elif chunk_id == 0x104:
+            block = checked_block(defined_format(data, offset, length))
+
+        elif chunk_id == 0x114:
+            block = checked_block(security_cycles(data[offset:offset+length]))
+
+        elif headers_only and length > HEADER_FRAMES_SIZE:
+            block = cassette.parse_block(
+                explicit_bits(data[offset:offset+HEADER_FRAMES_SIZE], minor, major, 0))
+            if block is None:
+                # The name is too long to fit in the start of the chunk
+                block = cassette.parse_block(
+                    explicit_bits(data[offset:offset+length], minor, major))
+        else:
+            block = cassette.parse_block(
+                explicit_bits(data[offset:offset+length], minor, major))
+
+        if block is not None:
+            block.position = offset
+            if headers_only:
+                block.block = None
+            yield block
+
+    # Report any problem found while decompressing the file after the blocks
+    # before it
+    error = getattr(data, "error", None)
+    if error is not None:
+        raise IOError(error)
+
+
+def open_stream(f, size):
+
+    # Return a window from the streams module onto the contents of an open
+    # UEF file, which may be gzipped, using a buffer of the given size,
+    # together with the minor and major version numbers of the file format.
+    # The file is only read, so pipes can be used. ValueError is raised if it
+    # is not a UEF file.
+
+    start = f.read(len(MAGIC))
+
+    if start == MAGIC:
+        window = streams.Window(f, size, start)
+    else:
+        window = streams.Window(streams.GunzipReader(f, start), size)
+
+    try:
+        header = window.take(HEADER_SIZE)
+    except IOError:
+        header = ""
+
+    if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a UEF file: %s" % getattr(f, "name", "<file>"))
+
+    return window, ord(header[len(MAGIC)]), ord(header[len(MAGIC)+1])
+
+
+def stream_blocks(window, minor, major):
+
+    # Generate the same blocks as read_blocks from a UEF file read through a
+    # window returned by open_stream, so that only the window and the chunk
+    # being decoded are held in memory. Other chunks are skipped without
+    # being kept.
+
+    unpack = CHUNK_HEADER.unpack
+    header_size = CHUNK_HEADER.size
+
+    while window.ensure(header_size) >= header_size:
+
+        chunk_id, length = unpack(window.take(header_size))
+        offset = window.offset
+
+        if chunk_id not in TAPE_CHUNKS or length <= 1:
+            window.skip(length)
+            continue
+
+        # The length of a truncated final chunk is reduced to fit the data
+        data = window.take(min(length, window.size))
+        if len(data) < length and not window.eof:
+            raise IOError("The input needs more memory than the limit allows")
+
+        if chunk_id in (0x104, 0x114):
+            block = checked_block(tape_data(chunk_id, data, minor, major))
+        else:
+            block = cassette.parse_block(tape_data(chunk_id, data, minor, major))
+
+        if block is not None:
+            block.position = offset
+            yield block
+
+
+class UEFWriter(object):
+
+    # Writes chunks to a UEF file, collecting them in a buffer which is only
+    # written to the file when it holds at least batch_size bytes, so that
+    # many small chunks are written in one call. The headers of the gap and
+    # data chunks written for each block are packed together in one call.
+
+    def __init__(self, f, batch_size = BATCH_SIZE):
+
+        self.f = f
+        self.batch_size = batch_size
+        self.buf = bytearray()
+
+    def write(self, data):
+
+        self.buf += data
+        if len(self.buf) >= self.batch_size:
+            self.flush()
+
+    def chunk(self, n, data):
+
+        self.buf += CHUNK_HEADER.pack(n, len(data))
+        self.write(data)
+
+    def gap(self, length):
+
+        # Write a gap of the given length in 1/20ths of a second.
+        self.write(GAP_CHUNK.pack(0x110, 2, length))
+
+    def write_header(self, creator, minor = 6, major = 0):
+
+        self.buf += MAGIC + chr(minor) + chr(major)
+
+        # Creator chunk, padded to a multiple of four bytes
+        we_are = creator + "\000"
+        if (len(we_are) % 4) != 0:
+            we_are = we_are + ("\000"*(4-(len(we_are) % 4)))
+
+        self.chunk(0, we_are)
+
+        # Platform chunk
+        self.chunk(5, chr(1))    # Electron with any keyboard layout
+
+    def start_tape(self):
+
+        # Write the carrier tone and dummy byte which precede the first block
+        self.gap(LONG_GAP)
+        self.chunk(0x100, chr(0xdc))
+
+    def block(self, parts, first = 0):
+
+        # Write a complete block, given as a sequence of parts which are
+        # written one after another, preceded by a long gap if it is the
+        # first block in a file - the preceding program may need time to
+        # complete running before it attempts to load the next one - or a
+        # short gap otherwise.
+
+        if first:
+            length = LONG_GAP
+        else:
+            length = SHORT_GAP
+
+        self.buf += GAP_AND_BLOCK.pack(0x110, 2, length, 0x100,
+                                       sum(map(len, parts)))
+        for part in parts:
+            self.buf += part
+
+        if len(self.buf) >= self.batch_size:
+            self.flush()
+
+    def end_tape(self):
+
+        # Write some finishing bytes
+        self.gap(SHORT_GAP)
+        self.write(GAP_CHUNK.pack(0x112, 2, SHORT_GAP))
+
+    def flush(self):
+
+        if self.buf:
+            self.f.write(self.buf)
+            self.buf = bytearray()